@@ -19,8 +19,16 @@ def resource_manager(args):
                                 profile=args.profile, 
                                 operation=args.operation,
                                 use_yaml_format=args.use_yaml_format,
+                                use_ndjson_format=args.use_ndjson_format,
                                 output_file=args.output_file,
-                                auto_approve=args.auto_approve
+                                auto_approve=args.auto_approve,
+                                scan_workers=args.scan_workers,
+                                scan_processes=args.scan_processes,
+                                scan_shard=args.scan_shard,
+                                discovery=args.discovery,
+                                cleanup_workers=args.cleanup_workers,
+                                use_snapshot=args.use_snapshot,
+                                refresh_snapshot=args.refresh_snapshot
                                 )
 
     training_tools.run(conf)
@@ -97,9 +105,41 @@ resource_manager_parser.add_argument('--yaml',
                                      help='print output in json format',
                                      action='store_true',
                                      dest='use_yaml_format')   
+resource_manager_parser.add_argument('--ndjson',
+                                     help='print output in newline delimited json format, one record per resource',
+                                     action='store_true',
+                                     dest='use_ndjson_format')
 resource_manager_parser.add_argument('--output',
                                      help='output file',
                                      dest='output_file')                         
+resource_manager_parser.add_argument('--scan-workers',
+                                     help='number of compartments and resource families scanned concurrently',
+                                     type=int,
+                                     dest='scan_workers')
+resource_manager_parser.add_argument('--scan-processes',
+                                     help='number of processes sharing the discovery',
+                                     type=int,
+                                     dest='scan_processes')
+resource_manager_parser.add_argument('--scan-shard',
+                                     help='unit of work of the scan processes',
+                                     choices=['region', 'compartment'],
+                                     dest='scan_shard')
+resource_manager_parser.add_argument('--discovery',
+                                     help='resource discovery mode',
+                                     choices=['list', 'search'],
+                                     dest='discovery')
+resource_manager_parser.add_argument('--cleanup-workers',
+                                     help='maximum number of resources terminated concurrently',
+                                     type=int,
+                                     dest='cleanup_workers')
+resource_manager_parser.add_argument('--use-snapshot',
+                                     help='reuse the inventory of a previous run if still valid instead of scanning the tenancy',
+                                     action='store_true',
+                                     dest='use_snapshot')
+resource_manager_parser.add_argument('--refresh-snapshot',
+                                     help='scan again only the compartments changed since the last snapshot according with Audit',
+                                     action='store_true',
+                                     dest='refresh_snapshot')
 
 
 def main():
@@ -15,7 +15,6 @@ from collections import namedtuple
 REGIONS = ['ca-toronto-1',
            'us-ashburn-1',
            'us-phoenix-1',
-           'ca-toronto-1',
            'eu-frankfurt-1',
            'uk-london-1']
 
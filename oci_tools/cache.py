@@ -0,0 +1,54 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+import oci
+
+from .oci_config import OCIConfig
+
+
+def _region_cache_file(conf: OCIConfig):
+    """
+    cache file path: one file per tenancy and profile
+    """
+    key = hashlib.sha1('{}:{}'.format(conf.tenancy, conf.profile).encode('utf-8')).hexdigest()
+    return os.path.join(conf.cache_dir, 'regions-{}.json'.format(key))
+
+
+def load_region_subscriptions(conf: OCIConfig):
+    """
+    load the region subscriptions from the cache
+
+    :param conf: OCIConfig object
+    :return: list of RegionSubscription or None if the cache is disabled, missing or expired
+    """
+    if conf.region_cache_ttl <= 0:
+        return None
+    try:
+        with open(_region_cache_file(conf)) as cache_file:
+            cached = json.load(cache_file)
+        if time.time() - cached['timestamp'] > conf.region_cache_ttl:
+            return None
+        return [oci.identity.models.RegionSubscription(**r) for r in cached['regions']]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_region_subscriptions(conf: OCIConfig, subscriptions):
+    """
+    store the region subscriptions in the cache
+
+    :param conf: OCIConfig object
+    :param subscriptions: list of RegionSubscription
+    """
+    if conf.region_cache_ttl <= 0:
+        return
+    try:
+        os.makedirs(conf.cache_dir, exist_ok=True)
+        with open(_region_cache_file(conf), 'w') as cache_file:
+            json.dump({'timestamp': time.time(),
+                       'regions': [oci.util.to_dict(r) for r in subscriptions]}, cache_file)
+    except OSError as e:
+        logging.warning('unable to write region cache: {}'.format(e))
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import oci
+
+
+class RateLimiter:
+    """
+    spread the api calls so that at most rate calls per second are started.
+    The calls exceeding the rate wait for their slot
+    """
+
+    def __init__(self, rate):
+        """
+        :param rate: maximum number of calls per second
+        """
+        self._interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self):
+        """
+        wait for the next call slot
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(self._next, now) + self._interval
+        if delay > 0:
+            time.sleep(delay)
+
+    def wrap(self, call):
+        """
+        :return: the function calling call once a slot is available
+        """
+        def _limited(*args, **kwargs):
+            self.acquire()
+            return call(*args, **kwargs)
+        return _limited
+
+
+class ClientPool:
+    """
+    SDK service clients shared by the whole run, one per (service, region).
+    The clients share a single request signer, so the private key is loaded once per profile,
+    every client keeps the HTTP session created by the SDK.
+    If rate_limit is set, the calls of all the clients of a region share the same RateLimiter.
+    The clients are created on first use, the pool is safe to use from the worker threads
+    """
+
+    def __init__(self, config, rate_limit=0):
+        """
+        :param config: SDK configuration of the profile
+        :param rate_limit: maximum number of api calls per second per region. 0 for no limit
+        """
+        self._config = dict(config)
+        self._rate_limit = rate_limit
+        # region -> RateLimiter
+        self._limiters = {}
+        self._lock = threading.Lock()
+        self._signer = None
+        # (client class, region, timeout) -> client
+        self._clients = {}
+
+    def get(self, service, region=None, timeout=None):
+        """
+        :param service: SDK client class, e.g. oci.core.ComputeClient
+        :param region: region name. Default: region of the profile
+        :param timeout: connection and read timeouts of the client, see the SDK clients. Default: SDK timeouts
+        :return: the shared client of the service in the region
+        """
+        key = (service, region or self._config.get('region'), timeout)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = self._create(*key)
+        return client
+
+    def _create(self, service, region, timeout):
+        if self._signer is None:
+            self._signer = oci.signer.Signer.from_config(self._config)
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+        client = service(dict(self._config, region=region), signer=self._signer, **kwargs)
+        if self._rate_limit > 0:
+            # every request of the client, pages and retries included, goes through call_api
+            limiter = self._limiters.setdefault(region, RateLimiter(self._rate_limit))
+            client.base_client.call_api = limiter.wrap(client.base_client.call_api)
+        return client
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
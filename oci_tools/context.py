@@ -0,0 +1,162 @@
+import oci
+
+from .oci_config import OCIConfig
+from .resource_registry import ResourceRegistry
+from .wait_engine import WaitEngine, wait_engine
+from . import listing
+
+
+class Scan:
+    """
+    run state of a discovery: the compartment trees of the regions, the inventory, the preserve policy
+    with its tag decisions and the wait engine of its terminations. The discovery creates a new scan and the cleanup
+    works on it, the configuration is never modified, so independent scans can run in the same process
+    """
+
+    def __init__(self, conf: OCIConfig):
+        """
+        :param conf: OCIConfig object
+        """
+        self.conf = conf
+        # region -> list of compartment trees
+        self.trees = {}
+        # inventory of the discovered resources
+        self.registry = ResourceRegistry()
+        # the tag decisions are cached for the scan only, the tags can change between two scans
+        self.preserve_policy = conf.preserve_policy.scoped()
+        self.wait_engine = WaitEngine()
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(self.trees))
+
+    def context(self, region):
+        """
+        :param region: region name
+        :return: RegionContext of the region bound to the scan
+        """
+        return RegionContext(self.conf, region, self)
+
+
+class RegionContext:
+    """
+    read-only view of the configuration bound to a region, carrying the SDK clients of the region.
+    The discovery and the cleanup receive it in place of OCIConfig: the settings are read from the
+    configuration, workon_region is the region of the context. The configuration is never modified,
+    so contexts of different regions can be used at the same time
+    """
+
+    __slots__ = ('_conf', '_region', '_scan')
+
+    def __init__(self, conf: OCIConfig, region, scan: Scan = None):
+        """
+        :param conf: OCIConfig object
+        :param region: region name
+        :param scan: Scan the context works on, None if the context doesn't access the discovered resources
+        """
+        object.__setattr__(self, '_conf', conf)
+        object.__setattr__(self, '_region', region)
+        object.__setattr__(self, '_scan', scan)
+
+    def __getattr__(self, name):
+        return getattr(self._conf, name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{} is read-only, {} can\'t be set'.format(type(self).__name__, name))
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self._region)
+
+    @property
+    def conf(self):
+        return self._conf
+
+    @property
+    def workon_region(self):
+        return self._region
+
+    @property
+    def scan(self):
+        return self._scan
+
+    @property
+    def preserve_policy(self):
+        """
+        :return: PreservePolicy of the scan, of the configuration if the context is not bound to a scan
+        """
+        return self._scan.preserve_policy if self._scan is not None else self._conf.preserve_policy
+
+    @property
+    def wait_engine(self):
+        """
+        :return: WaitEngine of the scan, the shared one if the context is not bound to a scan
+        """
+        return self._scan.wait_engine if self._scan is not None else wait_engine
+
+    @property
+    def registry(self):
+        """
+        :return: inventory of the scan
+        """
+        return self._scan.registry
+
+    @property
+    def trees(self):
+        """
+        :return: compartment trees of the region
+        """
+        return self._scan.trees[self._region]
+
+    @property
+    def config(self):
+        """
+        :return: SDK configuration of the region
+        """
+        return dict(self._conf.config, region=self._region)
+
+    def client(self, service):
+        """
+        :param service: SDK client class, e.g. oci.core.ComputeClient
+        :return: shared client of the service in the region
+        """
+        return self._conf.client_pool.get(service, self._region)
+
+    def list_all(self, list_call, *args, **kwargs):
+        """
+        retrieve all the pages of a list call with the configured page size, see listing.list_all
+        """
+        return listing.list_all(list_call, *args, page_size=self._conf.list_page_size, **kwargs)
+
+    @property
+    def identity_client(self):
+        """
+        compartments are global resources, they are managed from the home region
+        """
+        return self._conf.client_pool.get(oci.identity.IdentityClient, self._conf.home_region or self._region)
+
+    @property
+    def compute_client(self):
+        return self.client(oci.core.ComputeClient)
+
+    @property
+    def network_client(self):
+        return self.client(oci.core.VirtualNetworkClient)
+
+    @property
+    def bv_client(self):
+        return self.client(oci.core.BlockstorageClient)
+
+    @property
+    def lb_client(self):
+        return self.client(oci.load_balancer.LoadBalancerClient)
+
+    @property
+    def db_client(self):
+        return self.client(oci.database.DatabaseClient)
+
+    @property
+    def search_client(self):
+        return self.client(oci.resource_search.ResourceSearchClient)
+
+    @property
+    def audit_client(self):
+        return self.client(oci.audit.AuditClient)
@@ -0,0 +1,59 @@
+import oci
+
+from . import LIFECYCLE_INACTIVE_STATUS
+
+# largest page accepted by the list apis
+MAX_PAGE_SIZE = 1000
+
+# server side filter returning only the active resources: operation -> lifecycle states of the active resources.
+# The list apis accept a single lifecycle state, so the operation is called once per state. The filter is pushed
+# only where it saves more than it costs, i.e. the compartment subtree listing that returns also the deleted
+# compartments, kept for months. The other operations filter client side (is_active)
+ACTIVE_STATES = {
+    'list_compartments': ('ACTIVE', 'INACTIVE', 'CREATING'),
+}
+
+# reduced projection of the list operations, for the callers needing only the id and the lifecycle state,
+# i.e. the state refresh of the pending terminations. The fields of the projection are not documented,
+# the discovery always lists the full resources: the cleanup relies on their references (e.g. subnet_ids)
+SUMMARY_PROJECTION = {
+    'list_load_balancers': {'detail': 'simple'},
+}
+
+
+def list_all(list_call, *args, page_size=MAX_PAGE_SIZE, active_only=False, summary=False, **kwargs):
+    """
+    retrieve all the pages of a list call
+
+    :param list_call: SDK list operation
+    :param page_size: number of items requested per page
+    :param active_only: push the active lifecycle states filter to the server where the api supports it,
+    see ACTIVE_STATES
+    :param summary: request the reduced projection of the operation, if any
+    :param kwargs: list operation arguments, they take precedence over the listing defaults
+    :return: response with the data of all the pages
+    """
+    operation = getattr(list_call, '__name__', None)
+    defaults = {'limit': min(max(int(page_size), 1), MAX_PAGE_SIZE)}
+    if summary:
+        defaults.update(SUMMARY_PROJECTION.get(operation, {}))
+    states = ACTIVE_STATES.get(operation, ()) if active_only and 'lifecycle_state' not in kwargs else ()
+    if not states:
+        return oci.pagination.list_call_get_all_results(list_call, *args, **{**defaults, **kwargs})
+
+    response = None
+    for state in states:
+        state_response = oci.pagination.list_call_get_all_results(list_call, *args,
+                                                                   **{**defaults, 'lifecycle_state': state, **kwargs})
+        if response is None:
+            response = state_response
+        else:
+            response.data.extend(state_response.data)
+    return response
+
+
+def active_search_condition():
+    """
+    :return: Resource Search condition excluding the inactive resources
+    """
+    return ' && '.join("lifecycleState != '{}'".format(state) for state in LIFECYCLE_INACTIVE_STATUS)
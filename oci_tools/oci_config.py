@@ -1,7 +1,11 @@
 import oci
+import os
 import logging
 import configparser
 
+from .preserve import PreservePolicy
+from .client_pool import ClientPool
+
 
 class OCIConfig:
 
@@ -25,14 +29,17 @@ class OCIConfig:
         :param kwargs: command line parameters
         """
 
-        self._compartments_tree = None
         self._workon_region = None
         self._vcn_tree = {}
 
         profile = kwargs['profile'] if 'profile' in kwargs else 'DEFAULT'
+        self._profile = profile
         self._use_yaml_format = kwargs['use_yaml_format'] if 'use_yaml_format' in kwargs else False
+        self._use_ndjson_format = kwargs['use_ndjson_format'] if 'use_ndjson_format' in kwargs else False
         self._output_file = kwargs['output_file'] if 'output_file' in kwargs else ''
         self._auto_approve = kwargs['auto_approve'] if 'auto_approve' in kwargs else False
+        self._use_snapshot = kwargs['use_snapshot'] if 'use_snapshot' in kwargs else False
+        self._refresh_snapshot = kwargs['refresh_snapshot'] if 'refresh_snapshot' in kwargs else False
 
 
         cfg_parser = self.__OCIConfigParser()
@@ -43,26 +50,11 @@ class OCIConfig:
             exit(-1)
         self._config = oci.config.from_file(file_location=config_path, profile_name=profile)
 
-        self._defined_tags = {}
-        self._free_tags ={}
+        self._preserve_policy = None
+        self._client_pool = None
 
         def _set_config_attr(k, v):
             if v:
-                # if preserve_tags are provided, parse it
-                if k == 'preserve_tags':
-                    for tag in v.split(','):
-                        try:
-                            tag_kv = tag.split('=')
-                            tag_value = tag_kv[1] if len(tag_kv) > 1 else ''
-
-                            if tag_kv[0].find('.') > 0:
-                                self._defined_tags[tag_kv[0].split('.')[0]] = {
-                                                            tag_kv[0].split('.')[1]: tag_value}
-                            else:
-                                self._free_tags[tag_kv[0]] = tag_value
-                        except:
-                            logging.error('unable to parse tag {}'.format(tag))
-
                 setattr(self, '_config_{}'.format(k), v.split(',') if isinstance(v, str) and ',' in v else v)
 
         for key, value in cfg_parser.get_config(profile).items():
@@ -84,25 +76,23 @@ class OCIConfig:
             if not hasattr(self, '_config_operation') or not self._config_operation:
                 self._config_operation = 'list'
 
+    def __getstate__(self):
+        """
+        the configuration is sent to the scan processes without the clients,
+        every process creates its own clients
+        """
+        state = dict(self.__dict__)
+        state['_client_pool'] = None
+        return state
+
 
     @property
     def tenancy(self):
         return self._config_tenancy
 
     @property
-    def compartments_scope(self):
-        """
-        compartment list to work with
-        """
-        return self._config_compartment if hasattr(self, '_config_compartment') and self._config_compartment else self._config_tenancy
-
-    @property
-    def compartments_tree(self):
-        return self._compartments_tree
-
-    @compartments_tree.setter
-    def compartments_tree(self,c_tree):
-        self._compartments_tree = c_tree
+    def profile(self):
+        return self._profile
 
     @property
     def config(self):
@@ -155,11 +145,14 @@ class OCIConfig:
     @property
     def compartment_filter_toplevel_only(self):
         """
-        TODO: implement filter action applied only at top level compartments
+        specify if compartment_filter is matched only against the top level compartments.
+        If true only the subtrees of the filtered compartments are listed, otherwise the whole
+        compartment structure is listed and the filter is matched at any level
+        :return: Default value: False
         """
         if hasattr(self, '_config_compartment_filter_toplevel_only'):
-            return self._config_compartment_filter_toplevel_only and _config_compartment_filter_toplevel_only.lower() == 'true'
-        return True
+            return self._config_compartment_filter_toplevel_only.lower() == 'true'
+        return False
 
     @property
     def vcn_filter(self):
@@ -217,7 +210,29 @@ class OCIConfig:
 
     @property
     def preserve_tags(self):
-        return {'free-tags': self._free_tags, 'defined-tags': self._defined_tags}
+        return self.preserve_policy.tags
+
+    @property
+    def preserve_policy(self):
+        """
+        preserve_tags, preserve_compartments and compartment_filter compiled in a PreservePolicy
+        :return: PreservePolicy object
+        """
+        if self._preserve_policy is None:
+            self._preserve_policy = PreservePolicy(getattr(self, '_config_preserve_tags', None),
+                                                   self.preserve_compartments,
+                                                   self.compartment_filter)
+        return self._preserve_policy
+
+    @property
+    def client_pool(self):
+        """
+        SDK clients shared by the run: one client per service and region with a single signer
+        :return: ClientPool object
+        """
+        if self._client_pool is None:
+            self._client_pool = ClientPool(self.config, self.api_rate_limit)
+        return self._client_pool
 
     @property
     def skip_scan_preserved_resources(self):
@@ -231,9 +246,127 @@ class OCIConfig:
             return True
     
 
+    @property
+    def scan_workers(self):
+        """
+        number of concurrent workers used by the resource discovery
+        :return: Default value: 1 (sequential scan)
+        """
+        if hasattr(self, '_config_scan_workers'):
+            return max(int(self._config_scan_workers), 1)
+        return 1
+
+    @property
+    def scan_processes(self):
+        """
+        number of processes sharing the resource discovery, every process scans its shards
+        with scan_workers concurrent workers
+        :return: Default value: 1 (discovery in the current process)
+        """
+        if hasattr(self, '_config_scan_processes'):
+            return max(int(self._config_scan_processes), 1)
+        return 1
+
+    @property
+    def scan_shard(self):
+        """
+        unit of work of the scan processes
+         - region: every region is scanned by a single process
+         - compartment: every top level compartment of every region is scanned by a single process
+        :return: Default value: region
+        """
+        if hasattr(self, '_config_scan_shard'):
+            return self._config_scan_shard
+        return 'region'
+
+    @property
+    def discovery(self):
+        """
+        discovery mode
+         - list: list every resource family in every compartment
+         - search: use Resource Search to skip the compartments without resources of a family
+        :return: Default value: list
+        """
+        if hasattr(self, '_config_discovery'):
+            return self._config_discovery
+        return 'list'
+
+    @property
+    def list_page_size(self):
+        """
+        number of items requested per page by the list calls
+        :return: Default value: 1000 (largest page accepted by the list apis)
+        """
+        if hasattr(self, '_config_list_page_size'):
+            return int(self._config_list_page_size)
+        return 1000
+
+    @property
+    def api_rate_limit(self):
+        """
+        maximum number of api calls per second per region, shared by the discovery and the cleanup workers.
+        0 disables the limit
+        :return: Default value: 0
+        """
+        if hasattr(self, '_config_api_rate_limit'):
+            return max(float(self._config_api_rate_limit), 0)
+        return 0
+
+    @property
+    def cleanup_workers(self):
+        """
+        maximum number of resources terminated concurrently by the cleanup
+        :return: Default value: 1 (sequential cleanup)
+        """
+        if hasattr(self, '_config_cleanup_workers'):
+            return max(int(self._config_cleanup_workers), 1)
+        return 1
+
+    @property
+    def cache_dir(self):
+        """
+        directory where oci-tools keeps its cache files
+        :return: Default value: ~/.oci-tools
+        """
+        if hasattr(self, '_config_cache_dir'):
+            return os.path.expanduser(self._config_cache_dir)
+        return os.path.expanduser('~/.oci-tools')
+
+    @property
+    def region_cache_ttl(self):
+        """
+        validity in seconds of the cached region subscriptions. 0 disables the cache
+        :return: Default value: 86400
+        """
+        if hasattr(self, '_config_region_cache_ttl'):
+            return int(self._config_region_cache_ttl)
+        return 86400
+
+    @property
+    def snapshot_ttl(self):
+        """
+        validity in seconds of the inventory snapshot reused with --use-snapshot. 0 disables the snapshot store
+        :return: Default value: 3600
+        """
+        if hasattr(self, '_config_snapshot_ttl'):
+            return int(self._config_snapshot_ttl)
+        return 3600
+
+    @property
+    def use_snapshot(self):
+        return self._use_snapshot
+
+    @property
+    def refresh_snapshot(self):
+        return self._refresh_snapshot
+
     @property
     def use_yaml_format(self):
         return self._use_yaml_format
+
+    @property
+    def use_ndjson_format(self):
+        return self._use_ndjson_format
     
     @property
     def output_file(self):
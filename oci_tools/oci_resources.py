@@ -1,79 +1,194 @@
-import logging, time
+import logging
 import oci
-from oci.core import *
-from oci.load_balancer import *
-from oci.database import *
 import json
+import sys
 
-from . import LIFECYCLE_KO_STATUS, LIFECYCLE_INACTIVE_STATUS, RESOURCE as R
-from .oci_config import OCIConfig
+from . import LIFECYCLE_INACTIVE_STATUS, RESOURCE as R
+from .context import RegionContext
+from .scheduler import CleanupPlan
+from .wait_engine import wait_engine, completed
+from .serialization import model_to_dict, dict_to_model
+from .resource_registry import resource_descriptor, DESCRIPTORS, NESTED_TYPES
+from .listing import list_all
 
+# OCIDs of the related resources kept in the resource record, see OciResource.reference:
+# the references of the descriptors and the parent attributes of the nested types,
+# used to join the nested resources to their parents
+REFERENCE_FIELDS = tuple(sorted(
+    {'vnic_id'} | {attr for d in DESCRIPTORS.values() for attr in d.references}
+    | {d.parent_attribute for d in DESCRIPTORS.values() if d.parent_type not in (None, R.COMPARTMENT)}))
 
-class Registry:
-    """
-    helper class to keep track of the inner dependencies not inferable via compartment scanning
-    It contains a flat dict with all the resources.
-    """
 
-    def __init__(self):
-        self._resources = {}
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
 
-    def append(self, id, obj):
-        self._resources.setdefault(id, {}).update({'resource_type': obj.resource_type, 'resource': obj})
 
-    def set_dependency(self, id, obj):
-        self._resources.setdefault(id, {})
-        self._resources[id].setdefault('nested', []).append({obj.resource_type:obj})
-
-    def get(self, id):
-        if id in self._resources:
-            return self._resources[id]
-        return None
+def _reference(res, name):
+    """
+    :param name: model attribute. A dotted name reads the attribute of the items of a list attribute,
+    e.g. route_rules.network_entity_id
+    """
+    name, _, item_name = name.partition('.')
+    value = getattr(res, name, None)
+    if item_name and value:
+        value = [getattr(item, item_name, None) for item in value]
+        value = [v for v in value if v]
+    return value
 
 
-_registry = Registry()
+def _references(res):
+    """
+    :return: dict of the REFERENCE_FIELDS set in the SDK model, None if there are none
+    """
+    references = {}
+    for name in REFERENCE_FIELDS:
+        value = _reference(res, name)
+        if isinstance(value, list):
+            value = tuple(_intern(v) for v in value)
+        if value:
+            references[name] = _intern(value)
+    return references or None
 
 
 class OciResource(dict):
     """
     archetype for OCI resources
-    it contains the current resources and all the nested ones
+    it contains the current resources and all the nested ones.
+
+    The resource record keeps only the fields used by the cleanup, the SDK model is stored as compact json
+    and rebuilt on demand by the resource property
     """
-    @staticmethod
-    def set_dependency(parent_id, nested):
-        """
-        use the registry to inject nested dependency not inferable via compartment scan
 
-        :param parent_id: OCID id of the parent resource you want to append the neted to
-        :param nested:  nested OCI resource
-        """
-        _registry.set_dependency(parent_id, nested)
+    __slots__ = ('_name', '_id', '_resource_type', '_api_client', '_lifecycle_state', '_compartment',
+                 '_freeform_tags', '_defined_tags', '_references', '_model_class', '_blob', '_registry')
+
+    # ResourceDescriptor of the resource type: api client methods used to list the resources,
+    # to delete them and to read their lifecycle state
+    descriptor = resource_descriptor('resource', None, parent_type=None, parent_attribute=None)
 
-    def __init__(self, res, api_client=None, name='resource', id=None, res_type='resource'):
+    # the resource can be terminated only if the termination of its nested_cleanup_items succeeded
+    NESTED_CLEANUP_REQUIRED = True
+
+    def __init__(self, res, api_client=None, name=None, id=None, res_type=None):
         """
         Init OCI Resource
         :param res: OCI API resource
         :param api_client:  OCI API Client object
-        :param name: resource name/display_name
-        :param id: resource OCID
-        :param res_type: resource type
+        :param name: resource name/display_name. Default: the name attribute of the descriptor
+        :param id: resource OCID. Default: the id of the resource
+        :param res_type: resource type. Default: the type of the descriptor
         """
+        name = getattr(res, self.descriptor.name_attribute, None) if name is None else name
+        id = _intern(res.id if id is None else id)
+        res_type = self.descriptor.resource_type if res_type is None else res_type
         super().__init__({'name': name, 'id': id})
         self._name = name
         self._id = id
-        self._resource=res
         self._resource_type = res_type
         self._api_client = api_client
-        self._lifecycle_state = res.lifecycle_state if hasattr(res, 'lifecycle_state') else ''
-        self._compartment = res.compartment_id
-        _registry.append(self._id, self)
+        self._lifecycle_state = _intern(getattr(res, 'lifecycle_state', None)) or ''
+        self._compartment = _intern(res.compartment_id)
+        self._freeform_tags = getattr(res, 'freeform_tags', None) or None
+        self._defined_tags = getattr(res, 'defined_tags', None) or None
+        self._references = _references(res)
+        self._model_class = type(res)
+        self._blob = json.dumps(model_to_dict(res), separators=(',', ':')).encode('utf-8')
+        # ResourceRegistry the resource is indexed in, set by ResourceRegistry.index_region
+        self._registry = None
+
+    def to_record(self):
+        """
+        return the resource record without the api client and the nested resources, as accepted by from_record.
+        The record is picklable, it's used to move the discovered resources between processes
+        """
+        return (type(self), type(self._api_client).__name__, self._name, self._id, self._resource_type,
+                self._lifecycle_state, self._compartment, self._freeform_tags, self._defined_tags,
+                self._references, self._model_class, self._blob)
+
+    @staticmethod
+    def from_record(record, clients):
+        """
+        rebuild a resource from its record. The SDK model is not rebuilt
+
+        :param record: record returned by to_record
+        :param clients: dict client class name -> OCI API client
+        :return: OCI resource
+        """
+        (resource_class, client_class, name, id, res_type, lifecycle_state, compartment,
+         freeform_tags, defined_tags, references, model_class, blob) = record
+        res = resource_class.__new__(resource_class)
+        id = _intern(id)
+        dict.__init__(res, {'name': name, 'id': id})
+        res._name = name
+        res._id = id
+        res._resource_type = res_type
+        res._api_client = clients.get(client_class)
+        res._lifecycle_state = _intern(lifecycle_state)
+        res._compartment = _intern(compartment)
+        res._freeform_tags = freeform_tags
+        res._defined_tags = defined_tags
+        res._references = references
+        res._model_class = model_class
+        res._blob = blob
+        res._registry = None
+        return res
 
     @property
     def resource(self):
         """
-        return current resource in json format
+        return the SDK model of the resource. The model is rebuilt at every call
         """
-        return self._resource
+        return dict_to_model(self._model_class, self.to_json(nested=False))
+
+    @property
+    def model_class(self):
+        """
+        return the SDK model class of the resource
+        """
+        return self._model_class
+
+    @property
+    def blob(self):
+        """
+        return the resource in compact json format, utf-8 encoded
+        """
+        return self._blob
+
+    def reference(self, name):
+        """
+        OCID of a related resource read from the SDK model without rebuilding it
+
+        :param name: model attribute, one of REFERENCE_FIELDS
+        :return: OCID, tuple of OCIDs for the list attributes. None if not set
+        """
+        return self._references.get(name) if self._references else None
+
+    @property
+    def api_client(self):
+        """
+        return the OCI API client used to manage the resource
+        """
+        return self._api_client
+
+    def nested_cleanup_items(self):
+        """
+        :return: nested resources with their own delete operation, to terminate before the current one
+        """
+        return [nested for res_type in NESTED_TYPES.get(self.resource_type, ())
+                if DESCRIPTORS[res_type].delete_operation
+                for nested in self.get(res_type) or []]
+
+    def nested_dependencies(self):
+        """
+        return the resources injected as nested dependency via ResourceRegistry.set_dependency
+        """
+        return self._registry.get_dependencies(self.id) if self._registry is not None else []
+
+    def dependency_parents(self):
+        """
+        return the OCIDs of the resources the current one is injected into as nested dependency
+        """
+        return self._registry.get_dependents(self.id) if self._registry is not None else set()
 
     @property
     def nested_resources(self):
@@ -113,55 +228,163 @@ class OciResource(dict):
 
     @property
     def defined_tags(self):
-        return self.resource.defined_tags if hasattr(self.resource, 'defined_tags') else {}
+        return self._defined_tags or {}
 
     @property
     def freeform_tags(self):
-        return self.resource.freeform_tags if hasattr(self.resource, 'freeform_tags') else {}
+        return self._freeform_tags or {}
 
     def is_active(self):
         return self.lifecycle_state not in LIFECYCLE_INACTIVE_STATUS
 
-    def terminate(self,  simulate=False, preserve_tags={}, **kwargs):
+    def terminate(self,  simulate=False, preserve_policy=None, **kwargs):
         """
-        delete the resources and all the nested resources
+        delete the resources and all the nested resources and wait for the termination
         """
+        return self.submit_terminate(simulate, preserve_policy, **kwargs).result()
 
-        if self.check_tags(preserve_tags):
+    def submit_terminate(self, simulate=False, preserve_policy=None, engine=None, **kwargs):
+        """
+        submit the resource deletion without waiting for its completion
+
+        :param engine: WaitEngine tracking the termination. Default: the shared wait_engine
+        :return: Future resolved with True when the resource is terminated
+        """
+
+        if self.check_tags(preserve_policy):
             logging.info('::: skip resource termination [tag] {}'.format(self.name))
-            return False
+            return completed(False)
 
         logging.info(':: Terminating {} {} [{}]'.format(self.resource_type, self.name, self.id))
-        if self._terminate(simulate, preserve_tags=preserve_tags, **kwargs):
+        future = self._submit_terminate(simulate, preserve_policy=preserve_policy, engine=engine, **kwargs)
+        future.add_done_callback(self._log_termination)
+        return future
+
+    def _log_termination(self, future):
+        if future.result():
             logging.info(':: {} {} terminated [{}]'.format(self.resource_type, self.name, self.id))
-            return True
         else:
             logging.error(':: unable to terminate {} {} {}'.format(self.resource_type, self.name, self.id))
-            return False
 
-    def _terminate(self, simulate=False, preserve_tags={}, **kwargs):
+    def _submit_terminate(self, simulate=False, preserve_policy=None, engine=None, **kwargs):
         """
-        internal Terminate implementation
-        Child classes should override this method
+        internal termination submit implementation.
+        Child classes define the operations in their descriptor or override this method
         """
-        pass
-    
+
+        if not self.is_active():
+            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
+            return completed(False)
+
+        if simulate:
+            return completed(True)
+
+        try:
+            self._delete(**kwargs)
+        except oci.exceptions.ServiceError as se:
+            if se.status == 404:
+                return completed(True)
+            return completed(self._on_delete_error(se))
+        except Exception as e:
+            logging.error(str(e))
+            return completed(False)
+
+        if not self.descriptor.get_operation:
+            # synchronous deletion
+            self._set_lifecycle_state('DELETED')
+            return completed(True)
+
+        return (engine if engine is not None else wait_engine).track(self)
+
+    def _delete(self, **kwargs):
+        """
+        call the api deleting the resource
+        """
+        getattr(self._api_client, self.descriptor.delete_operation)(self.id)
+
+    def _on_delete_error(self, se):
+        """
+        handle the delete api errors
+
+        :return: True if the resource can be considered terminated
+        """
+        logging.error(se.message)
+        return False
+
+    def refresh_state(self):
+        """
+        read the current lifecycle state from the api
+
+        :return: lifecycle state. None if the resource doesn't exist anymore
+        """
+        try:
+            self._set_lifecycle_state(getattr(self._api_client, self.descriptor.get_operation)(self.id)
+                                      .data.lifecycle_state)
+        except oci.exceptions.ServiceError as se:
+            if se.status != 404:
+                raise se
+            self._set_lifecycle_state('DELETED')
+            return None
+        return self._lifecycle_state
+
+    def poll_group(self):
+        """
+        resources in the same poll group have their state refreshed with a single list call
+
+        :return: poll group key (api client, compartment, type). None if the list call is not supported
+        """
+        if not self.descriptor.list_operation:
+            return None
+        # api clients are bound to a region
+        return id(self._api_client), self._compartment, self._resource_type
+
+    def refresh_group_states(self, resources):
+        """
+        read the current lifecycle state of all the resources in the poll group with a single list call
+
+        :param resources: resources belonging to the same poll group of the current one
+        :return: list of lifecycle states. None for the resources that don't exist anymore
+        """
+        try:
+            # only the lifecycle state is needed
+            elems = list_all(getattr(self._api_client, self.descriptor.list_operation),
+                             compartment_id=self._compartment,
+                             summary=True)
+            states = {e.id: e.lifecycle_state for e in elems.data}
+        except oci.exceptions.ServiceError as se:
+            if se.status != 404:
+                raise se
+            states = {}
+
+        ret = []
+        for res in resources:
+            state = states.get(res.id)
+            res._set_lifecycle_state(state if state else 'DELETED')
+            ret.append(state)
+        return ret
+
     def _status(self):
         return self._lifecycle_state
 
-    def check_tags(self, preserve_tags):
-        for val in preserve_tags['free-tags'].keys():
-            if self.freeform_tags.get(val) == preserve_tags['free-tags'].get(val):
-                return True
-
-        for ns in preserve_tags['defined-tags'].keys():
-            if ns in self.defined_tags:
-                for val in preserve_tags['defined-tags'].get(ns).keys():
-                    if self.defined_tags[ns].get(val) == preserve_tags['defined-tags'][ns].get(val):
-                        return True
-    
-    def to_json(self, level=0):
-        r = json.loads(str(self.resource))
+    def _set_lifecycle_state(self, state):
+        """
+        update the lifecycle state keeping the registry index in sync
+        """
+        previous, self._lifecycle_state = self._lifecycle_state, _intern(state)
+        if previous != self._lifecycle_state and self._registry is not None:
+            self._registry.state_changed(self, previous)
+
+    def check_tags(self, preserve_policy):
+        """
+        :param preserve_policy: PreservePolicy object
+        :return: True if the resource has at least one of the preserved tags
+        """
+        return preserve_policy is not None and preserve_policy.is_tagged(self)
+
+    def to_json(self, level=0, nested=True):
+        r = json.loads(self._blob)
+        if not nested:
+            return r
         r['nested_resource'] = []
         for k in self.keys():
             if not k in ['id', 'name']:
@@ -176,58 +399,86 @@ class OciResource(dict):
 ####################################
 class OciCompartment(OciResource):
 
-    def __init__(self, res, api_client=None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.name,
-                         id=res.id,
-                         res_type=R.COMPARTMENT)
+    __slots__ = ()
+
+    descriptor = DESCRIPTORS[R.COMPARTMENT]
+
+    # resource types terminated by the compartment clean up
+    CLEANUP_RESOURCE_TYPES = [t for t in NESTED_TYPES[R.COMPARTMENT] if DESCRIPTORS[t].cleanup]
+    # resource types discovered but not terminated, e.g. block volumes: they survive the clean up
+    KEPT_RESOURCE_TYPES = [t for t in NESTED_TYPES[R.COMPARTMENT] if not DESCRIPTORS[t].cleanup]
 
     def cleanup(self,
-                config: OCIConfig,
+                config: RegionContext,
                 force=False,
+                plan: CleanupPlan = None,
+                compartment_plan: CleanupPlan = None,
                 **kwargs
                 ):
         """
         Clean up resource in a compartment.
+        The resources are added to a dependency graph and terminated concurrently
+        according with the dependencies.
 
         ****IMPORTANT*****
         compartments can be delete only if:
             1 - empty in every regions
             2 - the script is running against home region API
 
-        :param config: configuration object
+        :param config: RegionContext of the compartment region, bound to the scan that discovered it.
+        The settings are read from its configuration, the resources from the scan registry
         :param force: force termination of all the resources in the compartment
         in case compartment_filter is used then the compartments specified will be the top level compartments
+        :param plan: cleanup plan the resources are added to. If None the clean up is executed immediately
+        :param compartment_plan: cleanup plan the compartment deletions are added to. If None the compartments
+        are not deleted. Ignored if plan is None: resources and compartments are terminated together
         :return:
         """
 
+        if plan is not None:
+            return self._plan_cleanup(config, force, plan, compartment_plan, **kwargs)
+
+        plan = CleanupPlan(config.wait_engine)
+        for _, res in config.registry.preserved(config.workon_region):
+            plan.add_preserved(res)
+        ret = self._plan_cleanup(config, force, plan, plan, **kwargs)
+        plan.run(config.simulate_deletion, config.preserve_policy, config.cleanup_workers)
+        return ret
+
+    def _plan_cleanup(self, config: RegionContext, force, plan: CleanupPlan, compartment_plan: CleanupPlan, **kwargs):
+        """
+        add the compartment resources to the cleanup plan and the compartment to the compartment plan
+        """
+
         # if force then this is not a toplevel compartment
         preserve_top_level_compartment = False if force else config.preserve_top_level_compartment
 
-        # if force then the compartment resources must be deleted and compartment_filter ignored
-        compartment_filter = None if force else config.compartment_filter
-
         if not self.is_active():
             logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
             return False
 
         # skip the compartment if in preserve_compartments list or if it's tagged with the specified tags
-        if (config.preserve_compartments and self.name in config.preserve_compartments or
-                self.check_tags(config.preserve_tags)):
+        if config.preserve_policy.is_preserved_compartment(self):
+            # the parent compartments can't be deleted
+            plan.add_preserved(self)
+            if compartment_plan is not None and compartment_plan is not plan:
+                compartment_plan.add_preserved(self)
             return
 
         # preserve the compartment if the filter is not empty and the compartment is not in the list
+        # if force then the compartment resources must be deleted and compartment_filter ignored
+        preserve = not force and not config.preserve_policy.in_filter(self.name, self.id)
 
-        preserve = bool(compartment_filter) and self.name not in compartment_filter
-
-        items = self.get(R.COMPARTMENT)
-        for nested in [] if not items else items:
+        region = config.workon_region
+        nested_compartments = config.registry.query(region, compartment=self.id, resource_type=R.COMPARTMENT)
+        for nested in nested_compartments:
 
-            nested.cleanup(config=config,
-                           #if the current compartment is going to be delete, force = True
-                           force=force or not preserve,
-                           **kwargs)
+            nested._plan_cleanup(config=config,
+                                 #if the current compartment is going to be delete, force = True
+                                 force=force or not preserve,
+                                 plan=plan,
+                                 compartment_plan=compartment_plan,
+                                 **kwargs)
 
         # if preserve don't cleanup the resources
         if preserve:
@@ -236,593 +487,168 @@ class OciCompartment(OciResource):
 
         logging.info(':: cleaning up compartment {} [{}]'.format(self.name, self.id))
 
-        items = self.get(R.AUTONOMOUS_DB)
-        for nested in [] if not items else items:
-            nested.terminate(config.simulate_deletion, config.preserve_tags)
-
-        items = self.get(R.INSTANCE)
-        for nested in [] if not items else items:
-            nested.terminate(config.simulate_deletion, config.preserve_tags)
-
-        items = self.get(R.LB)
-        for nested in [] if not items else items:
-            nested.terminate(config.simulate_deletion, config.preserve_tags)
-
-        items = self.get(R.DB_SYSTEM)
-        # Due to a limitation with the Data Guard implementation on VM shapes
-        # primary db-system must be deleted before deleting db_home and
-        # standby db-system. So in case of any termination failure terminate
-        # operation is repeated
-        repeat = False
-        for nested in [] if not items else items:
-            repeat = not nested.terminate(config.simulate_deletion, config.preserve_tags) or repeat
-
-        if repeat:
-            for nested in [] if not items else items:
-                nested.terminate(config.simulate_deletion, config.preserve_tags)
-
-        items = self.get(R.DRG_ATTACHMENT)
-        for nested in [] if not items else items:
-            nested.terminate(config.simulate_deletion, config.preserve_tags)
-
-        items = self.get(R.VCN)
-        for nested in [] if not items else items:
-            nested.terminate(config.simulate_deletion, config.preserve_tags)
-
-        items = self.get(R.VPN)
-        for nested in [] if not items else items:
-            nested.terminate(config.simulate_deletion, config.preserve_tags)
-
-        items = self.get(R.CPE)
-        for nested in [] if not items else items:
-            nested.terminate(config.simulate_deletion, config.preserve_tags)
-
-        items = self.get(R.RPC)
-        for nested in [] if not items else items:
-            nested.terminate(config.simulate_deletion, config.preserve_tags)
-
-        items = self.get(R.DRG)
-        for nested in [] if not items else items:
-            nested.terminate(config.simulate_deletion, config.preserve_tags)
-
-        items = self.get(R.DB_BACKUP)
-        for nested in [] if not items else items:
-            nested.terminate(config.simulate_deletion, config.preserve_tags)
-
-        if not config.preserve_compartment_structure and not preserve_top_level_compartment:
-            self.terminate(config.simulate_deletion, config.preserve_tags)
+        # the compartment holding resources that are not terminated can't be deleted
+        for res_type in self.KEPT_RESOURCE_TYPES:
+            for kept in config.registry.query(region, compartment=self.id, resource_type=res_type):
+                plan.add_preserved(kept)
+
+        scope = []
+        for res_type in self.CLEANUP_RESOURCE_TYPES:
+            for nested in config.registry.query(region, compartment=self.id, resource_type=res_type):
+                plan.add(nested, scope=self.id)
+                scope.append(nested)
+                # the nested resources are scheduled one by one, e.g. vcn subnets and gateways
+                for item in nested.nested_cleanup_items():
+                    plan.add(item, scope=self.id)
+                    plan.add_dependency(item.id, nested.id, optional=not nested.NESTED_CLEANUP_REQUIRED)
+                    # e.g. the primary of a Data Guard standby db system is terminated before the standby db homes
+                    for first in nested.nested_dependencies():
+                        plan.add_dependency(first.id, item.id)
+                    scope.append(item)
+
+        if (compartment_plan is not None and
+                not config.preserve_compartment_structure and not preserve_top_level_compartment):
+            compartment_plan.add(self, scope=self.id)
+            for nested in scope:
+                compartment_plan.add_dependency(nested.id, self.id)
+            for nested in nested_compartments:
+                compartment_plan.add_dependency(nested.id, self.id)
             logging.info('::: terminate {}'.format(self.name))
 
         return True
 
-    def _terminate(self, simulate=False, **kwargs):
-
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
-
-        try:
-            oci.identity.IdentityClientCompositeOperations(self._api_client)\
-                .delete_compartment_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            self._status = 'DELETED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
-
 
 class OciInstance(OciResource):
 
-    def __init__(self, res, api_client:ComputeClient=None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.INSTANCE)
+    __slots__ = ()
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
+    descriptor = DESCRIPTORS[R.INSTANCE]
 
+    def _delete(self, **kwargs):
         # attached vnics are automatically detached and terminated
-        try:
-            oci.core.ComputeClientCompositeOperations(
-                self._api_client
-            ).terminate_instance_and_wait_for_state(self.id,
-                                                    LIFECYCLE_KO_STATUS,
-                                                    {'preserve_boot_volume': kwargs.pop('preserve_boot_volume', False)})
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+        self._api_client.terminate_instance(self.id,
+                                            preserve_boot_volume=kwargs.pop('preserve_boot_volume', False))
 
 
 class OciVnicAttachment(OciResource):
 
-    def __init__(self, res, api_client=None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.VNIC_ATTACHMENT)
+    __slots__ = ()
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
+    descriptor = DESCRIPTORS[R.VNIC_ATTACHMENT]
+
+    def _submit_terminate(self,  simulate=False, preserve_policy=None, engine=None, **kwargs):
         if not self.is_active():
             logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
+            return completed(False)
 
-        if simulate:
-            return True
+        return completed(simulate)
 
 
 class OciVcn(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.VCN)
-
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-
-        if not kwargs.pop('ignore_nested_resources', False):
-            # *** the below order is critical to avoid dependency issues ***
-            items = self.get(R.SUBNET)
-            for nested in [] if not items else items:
-                nested.terminate(simulate, preserve_tags, **kwargs)
-
-            items = self.get(R.SEC_LIST)
-            for nested in [] if not items else items:
-                nested.terminate(simulate, preserve_tags, **kwargs)
+    __slots__ = ()
 
-            items = self.get(R.ROUTE_TABLE)
-            for nested in [] if not items else items:
-                nested.terminate(simulate, preserve_tags, **kwargs)
-
-            items = self.get(R.IGW)
-            for nested in [] if not items else items:
-                nested.terminate(simulate, preserve_tags, **kwargs)
-
-            # repeat the route table termination to
-            items = self.get(R.ROUTE_TABLE)
-            for nested in [] if not items else items:
-                nested.terminate(simulate, preserve_tags, **kwargs)
-
-            items = self.get(R.LPEERINGGW)
-            for nested in [] if not items else items:
-                nested.terminate(simulate, preserve_tags, **kwargs)
-
-            items = self.get(R.NATGW)
-            for nested in [] if not items else items:
-                nested.terminate(simulate, preserve_tags, **kwargs)
-
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
-
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .delete_vcn_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.VCN]
 
 
 class OciSubnet(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.SUBNET)
-
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
+    __slots__ = ()
 
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
-
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .delete_subnet_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
-
-
-class _SubnetRegistry:
-    """
-    Registry to keep track of inter-compartment dependencies
-    """
-
-    def __init__(self):
-        self._registry = {}
-
-    def append(self, subnet: OciSubnet):
-        self._registry.setdefault(subnet.id, subnet)
-
-    def get(self, subnet_id):
-        return self._registry[subnet_id]
-
-
-_subnet_registry = _SubnetRegistry()
+    descriptor = DESCRIPTORS[R.SUBNET]
 
 
 class OciInternetGw(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.IGW)
-
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
+    __slots__ = ()
 
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .delete_internet_gateway_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return  False
+    descriptor = DESCRIPTORS[R.IGW]
 
 
 class OciNatGw(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.NATGW)
-
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
+    __slots__ = ()
 
-        if simulate:
-            return True
-
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .delete_nat_gateway_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.NATGW]
 
 
 class OciDRG(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.DRG)
+    __slots__ = ()
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
-
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .delete_drg_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.DRG]
 
 
 class OciDRGAttachment(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.DRG_ATTACHMENT)
-
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
+    __slots__ = ()
 
-        if simulate:
-            return True
-
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client) \
-                    .delete_drg_attachment_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.DRG_ATTACHMENT]
 
 
 class OciCPE(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.CPE)
+    __slots__ = ()
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
-
-        try:
-            self._api_client.delete_cpe(self.id)
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.CPE]
 
 
 class OciRPC(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.RPC)
+    __slots__ = ()
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
-
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .delete_remote_peering_connection_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.RPC]
 
 
 class OciVPN(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.VPN)
+    __slots__ = ()
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
-
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .delete_ip_sec_connection_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.VPN]
 
 
 class OciServiceGw(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.SERVICEGW)
+    __slots__ = ()
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
-
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .delete_service_gateway_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.SERVICEGW]
 
 
 class OciLocalPeeringGw(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.LPEERINGGW)
-
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
+    __slots__ = ()
 
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .delete_local_peering_gateway_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.LPEERINGGW]
 
 
 class OciSecurityList(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.SEC_LIST)
+    __slots__ = ()
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
+    descriptor = DESCRIPTORS[R.SEC_LIST]
+
+    def _on_delete_error(self, se):
         """
             The default security list for a given VCN can't be deleted
         """
-
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
+        if se.code == 'IncorrectState' and se.status == 409:
             return True
-
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .delete_security_list_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-
-            self._status = 'TERMINATED'
-            return  True
-        except oci.exceptions.ServiceError as se:
-            # the default SL can't be deleted
-            if se.code == 'IncorrectState' and se.status==409:
-                return True
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+        return super()._on_delete_error(se)
 
 
 class OciRouteTable(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.ROUTE_TABLE)
+    __slots__ = ()
+
+    descriptor = DESCRIPTORS[R.ROUTE_TABLE]
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
+    def _on_delete_error(self, se):
         """
         The default route table for a given VCN can't be deleted but need to be emptied.
         """
-
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
-
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .delete_route_table_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            # the default RT can't be deleted --> cleanup all the route rules
-            if se.code == 'IncorrectState' and se.status == 409:
-                return self.cleanup()
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+        if se.code == 'IncorrectState' and se.status == 409:
+            return self.cleanup()
+        return super()._on_delete_error(se)
 
     def cleanup(self):
         try:
@@ -835,236 +661,55 @@ class OciRouteTable(OciResource):
 
 class OciBlockVolume(OciResource):
 
-    def __init__(self, res, api_client: BlockstorageClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.BLOCKVOLUME)
+    __slots__ = ()
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
-
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .delete_volume_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.BLOCKVOLUME]
 
 
 class OciVnic(OciResource):
 
-    def __init__(self, res, api_client: VirtualNetworkClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.VNIC)
-
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
+    __slots__ = ()
 
-        try:
-            oci.core.VirtualNetworkClientCompositeOperations(self._api_client)\
-                .detach_vnic_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            self._status = 'TERMINATED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.VNIC]
 
 
 class OciLoadBalancer(OciResource):
 
-    def __init__(self, res, api_client: LoadBalancerClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.LB)
+    __slots__ = ()
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
-
-        try:
-            # waiter function doesn't work, so I'm checking manually the lifecycle of the resource
-            # if ServiceError.404 is returned then the resource has been deleted
-            self._api_client.delete_load_balancer(self.id)
-            while True:
-                time.sleep(3)
-                logging.info('checking lb status')
-                try:
-                    tmp = self._api_client.get_load_balancer(self.id)
-                    if tmp and tmp.data.lifecycle_state in LIFECYCLE_KO_STATUS:
-                        break
-                except oci.exceptions.ServiceError as se:
-                    if se.status == 404:
-                        break
-                    raise se
-            self._status = 'DELETED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.LB]
 
 
 class OciDbSystem(OciResource):
 
-    def __init__(self, res, api_client: DatabaseClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.DB_SYSTEM)
-
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
+    __slots__ = ()
 
-        try:
+    descriptor = DESCRIPTORS[R.DB_SYSTEM]
 
-            items = self.get(R.DB_HOME)
-            for nested in [] if not items else items:
-                nested.terminate(simulate, preserve_tags, **kwargs)
-
-            oci.database.DatabaseClientCompositeOperations(self._api_client)\
-                .terminate_db_system_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-
-            self._status = 'DELETED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    # the db homes are deleted first, the db system termination removes the ones left
+    NESTED_CLEANUP_REQUIRED = False
 
 
 class OciDBHome(OciResource):
 
-    def __init__(self, res, api_client: DatabaseClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.DB_HOME)
+    __slots__ = ()
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
-
-        if simulate:
-            return True
-
-        try:
-            oci.database.DatabaseClientCompositeOperations(self._api_client)\
-                .delete_db_home_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-
-            self._status = 'DELETED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.DB_HOME]
 
 
 class OciDbBackup(OciResource):
 
-    def __init__(self, res, api_client: DatabaseClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.DB_BACKUP)
-
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
+    __slots__ = ()
 
-        if simulate:
-            return True
-
-        try:
-            self._api_client.delete_backup(self.id)
-
-            self._status = 'DELETED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
+    descriptor = DESCRIPTORS[R.DB_BACKUP]
 
 
 class OciAutonomousDB(OciResource):
 
-    def __init__(self, res, api_client: DatabaseClient = None):
-        super().__init__(res,
-                         api_client=api_client,
-                         name=res.display_name,
-                         id=res.id,
-                         res_type=R.AUTONOMOUS_DB)
+    __slots__ = ()
 
-    def _terminate(self,  simulate=False, preserve_tags={}, **kwargs):
-        if not self.is_active():
-            logging.info('{} resource {} is not active'.format(self.resource_type, self.id))
-            return False
+    descriptor = DESCRIPTORS[R.AUTONOMOUS_DB]
 
-        if simulate:
-            return True
 
-        try:
-            oci.database.DatabaseClientCompositeOperations(self._api_client)\
-                .delete_autonomous_database_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            # if self.is_atp :
-            #     oci.database.DatabaseClientCompositeOperations(self._api_client)\
-            #     .delete_autonomous_database_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-            # else:
-            #     oci.database.DatabaseClientCompositeOperations(self._api_client)\
-            #         .delete_autonomous_data_warehouse_and_wait_for_state(self.id, LIFECYCLE_KO_STATUS)
-
-            self._status = 'DELETED'
-            return True
-        except oci.exceptions.ServiceError as se:
-            logging.error(se.message)
-            return False
-        except Exception as e:
-            logging.error(str(e))
-            return False
\ No newline at end of file
+# resource type -> resource class
+RESOURCE_CLASSES = {cls.descriptor.resource_type: cls for cls in OciResource.__subclasses__()}
@@ -0,0 +1,133 @@
+import json
+import logging
+from contextlib import contextmanager
+
+import yaml
+
+from .oci_config import OCIConfig
+from .oci_resources import OciResource
+
+# use the libyaml emitter when available
+_YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+
+class _Writer:
+    """
+    streaming writer of the compartment trees.
+    Every region is written as soon as it's available and only one compartment subtree
+    at a time is serialized, so the memory used doesn't depend on the size of the tenancy
+    """
+
+    def __init__(self, emit):
+        """
+        :param emit: function called with every chunk of output. A chunk is made of complete lines
+        """
+        self._emit = emit
+
+    def write_region(self, region, trees):
+        """
+        :param region: region name
+        :param trees: list of compartment trees of the region
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonWriter(_Writer):
+    """
+    {region: [compartment tree, ...], ...} with the same layout of json.dumps(indent=3, sort_keys=True)
+    """
+
+    def __init__(self, emit):
+        super().__init__(emit)
+        # last line of the previous region: it's followed by a comma if another region is written
+        self._pending = None
+
+    def write_region(self, region, trees):
+        head = '{' if self._pending is None else '{},'.format(self._pending)
+        if not trees:
+            self._emit(head)
+            self._pending = '   {}: []'.format(json.dumps(region))
+            return
+        head = '{}\n   {}: ['.format(head, json.dumps(region))
+        for i, tree in enumerate(trees):
+            subtree = json.dumps(tree.to_json(), indent=3, sort_keys=True).replace('\n', '\n      ')
+            self._emit('{}      {}{}'.format(head + '\n' if i == 0 else '', subtree, ',' if i < len(trees) - 1 else ''))
+        self._pending = '   ]'
+
+    def close(self):
+        self._emit('{}' if self._pending is None else '{}\n}}'.format(self._pending))
+
+
+class YamlWriter(_Writer):
+    """
+    {region: [compartment tree, ...], ...} with the same layout of yaml.dump(indent=3, sort_keys=True)
+    """
+
+    def __init__(self, emit):
+        super().__init__(emit)
+        self._empty = True
+
+    def write_region(self, region, trees):
+        self._empty = False
+        if not trees:
+            self._emit('{}: []'.format(region))
+            return
+        self._emit('{}:'.format(region))
+        for tree in trees:
+            self._emit(yaml.dump([tree.to_json()], Dumper=_YAML_DUMPER, indent=3, sort_keys=True).rstrip('\n'))
+
+    def close(self):
+        if self._empty:
+            self._emit('{}')
+
+
+class NdjsonWriter(_Writer):
+    """
+    one json record per resource:
+    {"region": ..., "resource_type": ..., "parent_id": ..., "resource": {...}}
+    """
+
+    def write_region(self, region, trees):
+        for tree in trees:
+            self._emit('\n'.join(self._records(region, tree)))
+
+    def _records(self, region, res: OciResource, parent_id=None):
+        yield json.dumps({'region': region,
+                          'resource_type': res.resource_type,
+                          'parent_id': parent_id,
+                          'resource': res.to_json(nested=False)}, sort_keys=True)
+        for items in res.values():
+            if isinstance(items, list):
+                for nested in items:
+                    yield from self._records(region, nested, res.id)
+
+
+@contextmanager
+def open_writer(config: OCIConfig):
+    """
+    writer of the configured output format.
+    The output is written in the output file if provided, otherwise it's logged
+
+    :param config: OCIConfig object
+    """
+    if config.use_ndjson_format:
+        writer_class = NdjsonWriter
+    elif config.use_yaml_format:
+        writer_class = YamlWriter
+    else:
+        writer_class = JsonWriter
+
+    if not config.print_to_file:
+        writer = writer_class(logging.info)
+        yield writer
+        writer.close()
+        return
+
+    with open(config.output_file, 'w') as output_file:
+        writer = writer_class(lambda chunk: output_file.write(chunk + '\n'))
+        yield writer
+        writer.close()
+    logging.info('Output written to {}'.format(config.output_file))
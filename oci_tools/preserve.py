@@ -0,0 +1,164 @@
+import copy
+import logging
+import re
+
+# prefix of the name patterns matched as regular expressions
+REGEX_PREFIX = 're:'
+
+
+def _as_list(value):
+    if not value:
+        return []
+    return [v.strip() for v in (value if isinstance(value, list) else value.split(',')) if v.strip()]
+
+
+class NameMatcher:
+    """
+    compiled list of names. Every item is either:
+     - an exact name or OCID, matched with a set lookup
+     - a prefix ending with *, e.g. training-*
+     - a regular expression starting with re:, e.g. re:^team[0-9]+$
+    """
+
+    def __init__(self, patterns):
+        """
+        :param patterns: list or comma separated string of name patterns
+        """
+        self._names = set()
+        prefixes, regexes = [], []
+        for pattern in _as_list(patterns):
+            if pattern.startswith(REGEX_PREFIX):
+                regexes.append('(?:{})'.format(pattern[len(REGEX_PREFIX):]))
+            elif pattern.endswith('*'):
+                prefixes.append(pattern[:-1])
+            else:
+                self._names.add(pattern)
+        self._prefixes = tuple(prefixes)
+        self._regex = None
+        if regexes:
+            try:
+                self._regex = re.compile('|'.join(regexes))
+            except re.error as e:
+                logging.error('unable to parse name pattern {}: {}'.format(', '.join(regexes), e))
+        self._empty = not (self._names or self._prefixes or self._regex)
+
+    def __bool__(self):
+        return not self._empty
+
+    def match(self, name):
+        """
+        :return: True if the name matches at least one pattern
+        """
+        if self._empty or name is None:
+            return False
+        return (name in self._names or
+                bool(self._prefixes) and name.startswith(self._prefixes) or
+                self._regex is not None and self._regex.search(name) is not None)
+
+
+class PreservePolicy:
+    """
+    preserve_tags, preserve_compartments and compartment_filter compiled once.
+    The tags are matched with hash lookups on the tags of the resource and the
+    decisions are memoized per resource OCID and tags, so discovery and cleanup evaluate
+    every resource only once. Every scan works on its own copy of the policy, see scoped
+    """
+
+    def __init__(self, preserve_tags=None, preserve_compartments=None, compartment_filter=None):
+        """
+        :param preserve_tags: list or comma separated string of tags. Free-form tags: key=value or key,
+        defined tags: namespace.key=value or namespace.key. A tag without value matches on the key only
+        :param preserve_compartments: name patterns of the compartments to preserve, see NameMatcher
+        :param compartment_filter: name patterns of the compartments to clean up, see NameMatcher
+        """
+        # (key, value) and key for the free-form tags, (namespace, key, value) and (namespace, key) for the defined
+        self._free_values, self._free_keys = set(), set()
+        self._defined_values, self._defined_keys = set(), set()
+        self._free_tags, self._defined_tags = {}, {}
+        for tag in _as_list(preserve_tags):
+            key, sep, value = tag.partition('=')
+            namespace, dot, name = key.partition('.')
+            if dot and namespace:
+                self._defined_tags.setdefault(namespace, {})[name] = value if sep else None
+                if sep:
+                    self._defined_values.add((namespace, name, value))
+                else:
+                    self._defined_keys.add((namespace, name))
+            else:
+                self._free_tags[key] = value if sep else None
+                if sep:
+                    self._free_values.add((key, value))
+                else:
+                    self._free_keys.add(key)
+
+        self._compartments = NameMatcher(preserve_compartments)
+        self._filter = NameMatcher(compartment_filter)
+        # (resource OCID, tags) -> preserve decision
+        self._decisions = {}
+
+    def scoped(self):
+        """
+        :return: a policy with the same settings and an empty decision cache
+        """
+        policy = copy.copy(self)
+        policy._decisions = {}
+        return policy
+
+    @property
+    def tags(self):
+        """
+        :return: preserved tags {'free-tags': {key: value}, 'defined-tags': {namespace: {key: value}}},
+        value is None for the tags matched on the key only
+        """
+        return {'free-tags': self._free_tags, 'defined-tags': self._defined_tags}
+
+    def is_tagged(self, res):
+        """
+        :param res: OciResource
+        :return: True if the resource has at least one of the preserved tags
+        """
+        freeform_tags, defined_tags = res.freeform_tags or {}, res.defined_tags or {}
+        key = (res.id, tuple(freeform_tags.items()),
+               tuple((namespace, tuple((k, str(v)) for k, v in (tags or {}).items()))
+                     for namespace, tags in defined_tags.items()))
+        decision = self._decisions.get(key)
+        if decision is None:
+            decision = self._decisions[key] = self._match_tags(freeform_tags, defined_tags)
+        return decision
+
+    def _match_tags(self, freeform_tags, defined_tags):
+        if self._free_values or self._free_keys:
+            for key, value in freeform_tags.items():
+                if key in self._free_keys or (key, value) in self._free_values:
+                    return True
+        if self._defined_values or self._defined_keys:
+            for namespace, tags in defined_tags.items():
+                for key, value in (tags or {}).items():
+                    if (namespace, key) in self._defined_keys or (namespace, key, str(value)) in self._defined_values:
+                        return True
+        return False
+
+    def is_preserved_compartment(self, compartment):
+        """
+        :param compartment: OciCompartment
+        :return: True if the compartment is listed in preserve_compartments or it has a preserved tag
+        """
+        return self._compartments.match(compartment.name) or self.is_tagged(compartment)
+
+    def is_preserved_name(self, name):
+        """
+        :return: True if the compartment name is listed in preserve_compartments
+        """
+        return self._compartments.match(name)
+
+    @property
+    def has_filter(self):
+        return bool(self._filter)
+
+    def in_filter(self, name, id=None):
+        """
+        :param name: compartment name
+        :param id: compartment OCID, compartment_filter accepts also OCIDs
+        :return: True if the compartment is listed in compartment_filter or the filter is empty
+        """
+        return not self._filter or self._filter.match(name) or self._filter.match(id)
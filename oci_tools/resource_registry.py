@@ -1,3 +1,392 @@
-from .oci_resources import OciResource
-import logging
+import threading
+from collections import namedtuple, OrderedDict
 
+from . import RESOURCE as R
+
+# declarative description of a resource type, driving the discovery and the termination:
+#  - name_attribute: model attribute with the resource name
+#  - client: RegionContext property returning the api client of the type
+#  - list_operation: api client method listing the resources of the type in a compartment
+#  - parent_type, parent_attribute: type of the resource the current one is nested in and the model attribute
+#    with the parent OCID. The resources nested in a compartment are listed by the discovery, the nested
+#    types are listed once per compartment and joined to their parents
+#  - delete_operation: api client method deleting the resource
+#  - get_operation: api client method reading the lifecycle state. If None the deletion is synchronous
+#  - search_type: Resource Search type. The types without one are always scanned by the search discovery
+#  - dependencies: within the same compartment, the resources of the type must be terminated
+#    before the resources of the listed types
+#  - skip_preserved: the preserved resources are skipped by the discovery (skip_scan_preserved_resources)
+#  - references: model attributes with the OCIDs of the resources that can be terminated only after
+#    the current one. The list attributes hold more than one OCID, a dotted name reads the attribute
+#    of the items of a list attribute (e.g. the targets of the route rules)
+#  - cleanup: the resources nested in a compartment are terminated by the compartment clean up
+ResourceDescriptor = namedtuple('ResourceDescriptor',
+                                'resource_type '
+                                'name_attribute '
+                                'client '
+                                'list_operation '
+                                'parent_type '
+                                'parent_attribute '
+                                'delete_operation '
+                                'get_operation '
+                                'search_type '
+                                'dependencies '
+                                'skip_preserved '
+                                'references '
+                                'cleanup')
+
+
+def resource_descriptor(resource_type, client, list_operation=None,
+                        parent_type=R.COMPARTMENT, parent_attribute='compartment_id',
+                        delete_operation=None, get_operation=None, search_type=None, dependencies=(),
+                        skip_preserved=True, name_attribute='display_name', references=(), cleanup=True):
+    """
+    :return: ResourceDescriptor, see the descriptor fields above
+    """
+    return ResourceDescriptor(resource_type, name_attribute, client, list_operation, parent_type, parent_attribute,
+                              delete_operation, get_operation, search_type, dependencies, skip_preserved,
+                              references, cleanup)
+
+
+# resource type -> ResourceDescriptor, in discovery order
+DESCRIPTORS = OrderedDict((d.resource_type, d) for d in [
+    # compartments are listed by the compartment hierarchy, not by the resource discovery
+    resource_descriptor(R.COMPARTMENT, 'identity_client', 'list_compartments',
+                        delete_operation='delete_compartment', get_operation='get_compartment',
+                        name_attribute='name'),
+    resource_descriptor(R.VCN, 'network_client', 'list_vcns',
+                        delete_operation='delete_vcn', get_operation='get_vcn', search_type='Vcn',
+                        skip_preserved=False),
+    resource_descriptor(R.SUBNET, 'network_client', 'list_subnets', R.VCN, 'vcn_id',
+                        delete_operation='delete_subnet', get_operation='get_subnet', search_type='Subnet',
+                        dependencies=(R.SEC_LIST, R.ROUTE_TABLE),
+                        references=('vcn_id', 'route_table_id', 'security_list_ids', 'dhcp_options_id')),
+    resource_descriptor(R.IGW, 'network_client', 'list_internet_gateways', R.VCN, 'vcn_id',
+                        delete_operation='delete_internet_gateway', get_operation='get_internet_gateway',
+                        search_type='InternetGateway', references=('vcn_id',)),
+    resource_descriptor(R.NATGW, 'network_client', 'list_nat_gateways', R.VCN, 'vcn_id',
+                        delete_operation='delete_nat_gateway', get_operation='get_nat_gateway',
+                        search_type='NatGateway', references=('vcn_id',)),
+    resource_descriptor(R.SEC_LIST, 'network_client', 'list_security_lists', R.VCN, 'vcn_id',
+                        delete_operation='delete_security_list', get_operation='get_security_list',
+                        search_type='SecurityList', references=('vcn_id',)),
+    resource_descriptor(R.ROUTE_TABLE, 'network_client', 'list_route_tables', R.VCN, 'vcn_id',
+                        delete_operation='delete_route_table', get_operation='get_route_table',
+                        search_type='RouteTable', dependencies=(R.IGW, R.NATGW, R.LPEERINGGW, R.SERVICEGW),
+                        references=('vcn_id', 'route_rules.network_entity_id')),
+    resource_descriptor(R.LPEERINGGW, 'network_client', 'list_local_peering_gateways', R.VCN, 'vcn_id',
+                        delete_operation='delete_local_peering_gateway', get_operation='get_local_peering_gateway',
+                        search_type='LocalPeeringGateway', references=('vcn_id',)),
+    resource_descriptor(R.SERVICEGW, 'network_client', 'list_service_gateways', R.VCN, 'vcn_id',
+                        delete_operation='delete_service_gateway', get_operation='get_service_gateway',
+                        search_type='ServiceGateway', references=('vcn_id',)),
+    resource_descriptor(R.DRG, 'network_client', 'list_drgs',
+                        delete_operation='delete_drg', get_operation='get_drg', search_type='Drg'),
+    resource_descriptor(R.CPE, 'network_client', 'list_cpes',
+                        delete_operation='delete_cpe', search_type='Cpe'),
+    resource_descriptor(R.DRG_ATTACHMENT, 'network_client', 'list_drg_attachments',
+                        delete_operation='delete_drg_attachment', get_operation='get_drg_attachment',
+                        dependencies=(R.VCN, R.DRG), references=('vcn_id', 'drg_id')),
+    resource_descriptor(R.RPC, 'network_client', 'list_remote_peering_connections',
+                        delete_operation='delete_remote_peering_connection',
+                        get_operation='get_remote_peering_connection',
+                        search_type='RemotePeeringConnection', dependencies=(R.DRG,), references=('drg_id',)),
+    resource_descriptor(R.VPN, 'network_client', 'list_ip_sec_connections',
+                        delete_operation='delete_ip_sec_connection', get_operation='get_ip_sec_connection',
+                        search_type='IPSecConnection', dependencies=(R.CPE, R.DRG), references=('cpe_id', 'drg_id')),
+    # block volumes are discovered but not terminated
+    resource_descriptor(R.BLOCKVOLUME, 'bv_client', 'list_volumes',
+                        delete_operation='delete_volume', get_operation='get_volume', search_type='Volume',
+                        cleanup=False),
+    resource_descriptor(R.INSTANCE, 'compute_client', 'list_instances',
+                        delete_operation='terminate_instance', get_operation='get_instance', search_type='Instance',
+                        dependencies=(R.SUBNET,), skip_preserved=False),
+    # vnic attachments are terminated together with their instance
+    resource_descriptor(R.VNIC_ATTACHMENT, 'compute_client', 'list_vnic_attachments', R.INSTANCE, 'instance_id',
+                        references=('subnet_id',)),
+    resource_descriptor(R.LB, 'lb_client', 'list_load_balancers',
+                        delete_operation='delete_load_balancer', get_operation='get_load_balancer',
+                        search_type='LoadBalancer', dependencies=(R.SUBNET,), references=('subnet_ids',)),
+    resource_descriptor(R.DB_SYSTEM, 'db_client', 'list_db_systems',
+                        delete_operation='terminate_db_system', get_operation='get_db_system',
+                        search_type='DbSystem', references=('subnet_id',)),
+    resource_descriptor(R.DB_HOME, 'db_client', 'list_db_homes', R.DB_SYSTEM, 'db_system_id',
+                        delete_operation='delete_db_home', get_operation='get_db_home', skip_preserved=False),
+    resource_descriptor(R.DB_BACKUP, 'db_client', 'list_backups',
+                        delete_operation='delete_backup', get_operation='get_backup'),
+    resource_descriptor(R.AUTONOMOUS_DB, 'db_client', 'list_autonomous_databases',
+                        delete_operation='delete_autonomous_database', get_operation='get_autonomous_database',
+                        search_type='AutonomousDatabase', references=('subnet_id',)),
+    # vnics are not discovered, they are detached with their vnic attachment
+    resource_descriptor(R.VNIC, 'network_client', parent_type=None, parent_attribute=None,
+                        delete_operation='detach_vnic', get_operation='get_vnic', references=('subnet_id',)),
+])
+
+
+def _nested_types():
+    nested = OrderedDict()
+    for d in DESCRIPTORS.values():
+        if d.parent_type and d.resource_type != R.COMPARTMENT:
+            nested.setdefault(d.parent_type, []).append(d.resource_type)
+    return nested
+
+
+# resource type -> types of the resources nested in it, in discovery order
+NESTED_TYPES = _nested_types()
+
+# secondary indexes of the inventory: index name -> function returning the indexed values of a resource
+_INDEXES = {
+    'id': lambda res: (res.id,),
+    'resource_type': lambda res: (res.resource_type,),
+    'compartment': lambda res: (res.compartment,),
+    'lifecycle_state': lambda res: (res.lifecycle_state,),
+    'tag': lambda res: _tag_keys(res),
+}
+
+
+def _tag_keys(res):
+    """
+    tags in the preserve_tags format: key, key=value for the free-form tags
+    and namespace.key, namespace.key=value for the defined tags
+    """
+    keys = []
+    for key, value in res.freeform_tags.items():
+        keys += [key, '{}={}'.format(key, value)]
+    for ns, tags in res.defined_tags.items():
+        for key, value in (tags or {}).items():
+            keys += ['{}.{}'.format(ns, key), '{}.{}={}'.format(ns, key, value)]
+    return keys
+
+
+def _walk(trees):
+    for tree in trees:
+        yield tree
+        for items in tree.values():
+            if isinstance(items, list):
+                yield from _walk(items)
+
+
+class ResourceRegistry:
+    """
+    inventory of the discovered resources.
+    The resources are indexed per region by OCID, type, compartment, lifecycle state and tag
+    (see query). The registry keeps also the nested dependencies not inferable via compartment
+    scanning together with the reverse index nested -> parents, per region.
+    Compartments are replicated in every region tree, so a resource is identified by (region, OCID).
+    Every discovery has its own registry (see context.Scan), the indexed resources are bound to it
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # (region, OCID) -> resource
+        self._resources = {}
+        # (region, OCID) -> position in the region tree, the query results follow the tree pre-order
+        self._positions = {}
+        self._next_position = 0
+        # index name -> value -> set of (region, OCID)
+        self._indexes = {name: {} for name in ('region', *_INDEXES)}
+        # region -> parent OCID -> nested OCID -> nested resource
+        self._nested = {}
+        # region -> nested OCID -> set of parent OCIDs
+        self._parents = {}
+        # region -> scan scope -> OCID -> preserved resource not included in the compartment trees
+        self._preserved = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._resources)
+
+    def index_region(self, region, trees):
+        """
+        replace the indexed resources of the region with the resources of the compartment trees
+
+        :param region: region name
+        :param trees: list of compartment trees
+        """
+        with self._lock:
+            for key in list(self._indexes['region'].get(region, ())):
+                self._remove(key)
+            for res in _walk(trees):
+                key = (region, res.id)
+                if key in self._resources:
+                    # already indexed, e.g. a resource nested in more than one tree
+                    continue
+                self._resources[key] = res
+                # the resource keeps the index in sync with its lifecycle state
+                res._registry = self
+                self._positions[key] = self._next_position
+                self._next_position += 1
+                self._add_to_index('region', region, key)
+                for name, values in _INDEXES.items():
+                    for value in values(res):
+                        self._add_to_index(name, value, key)
+
+    def _add_to_index(self, name, value, key):
+        self._indexes[name].setdefault(value, set()).add(key)
+
+    def _remove_from_index(self, name, value, key):
+        keys = self._indexes[name].get(value)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._indexes[name][value]
+
+    def _remove(self, key):
+        res = self._resources.pop(key)
+        if res._registry is self:
+            res._registry = None
+        del self._positions[key]
+        self._remove_from_index('region', key[0], key)
+        for name, values in _INDEXES.items():
+            for value in values(res):
+                self._remove_from_index(name, value, key)
+
+    def state_changed(self, res, previous_state):
+        """
+        move the resource to the index of its current lifecycle state
+
+        :param res: resource whose lifecycle state is changed
+        :param previous_state: lifecycle state the resource is indexed with
+        """
+        with self._lock:
+            for key in list(self._indexes['id'].get(res.id, ())):
+                if self._resources[key] is res:
+                    self._remove_from_index('lifecycle_state', previous_state, key)
+                    self._add_to_index('lifecycle_state', res.lifecycle_state, key)
+
+    def query(self, region=None, **criteria):
+        """
+        find the resources matching all the criteria, e.g.
+        query(region='us-ashburn-1', compartment=compartment_id, resource_type=R.VCN)
+
+        :param region: region name
+        :param criteria: id, resource_type, compartment, lifecycle_state, tag (key, key=value,
+        namespace.key or namespace.key=value)
+        :return: list of the matching resources in discovery order
+        """
+        if region is not None:
+            criteria['region'] = region
+        with self._lock:
+            if not criteria:
+                keys = self._resources.keys()
+            else:
+                matches = sorted((self._indexes[name].get(value, set()) for name, value in criteria.items()), key=len)
+                keys = set(matches[0]).intersection(*matches[1:])
+            return [self._resources[key] for key in sorted(keys, key=self._positions.__getitem__)]
+
+    def get(self, id, region=None):
+        """
+        :param id: OCID
+        :param region: region name, needed only for the compartments
+        :return: the resource or None if not indexed
+        """
+        found = self.query(region, id=id)
+        return found[0] if found else None
+
+    def count(self, region=None, index='resource_type'):
+        """
+        :return: dict value -> number of resources for the given index
+        """
+        with self._lock:
+            keys = self._indexes['region'].get(region, set()) if region is not None else None
+            return {value: len(matches if keys is None else matches & keys)
+                    for value, matches in self._indexes[index].items()
+                    if keys is None or matches & keys}
+
+    def set_dependency(self, region, parent_id, nested):
+        """
+        register a nested dependency not inferable via compartment scanning:
+        nested must be terminated before parent_id.
+        A dependency registered again replaces the previous one
+
+        :param region: region name
+        :param parent_id: OCID of the parent resource
+        :param nested: nested OCI resource
+        """
+        with self._lock:
+            self._nested.setdefault(region, {}).setdefault(parent_id, {})[nested.id] = nested
+            self._parents.setdefault(region, {}).setdefault(nested.id, set()).add(parent_id)
+
+    def clear_dependencies(self, region, compartments=None):
+        """
+        drop the dependencies of the nested resources of the compartments, before scanning them again
+
+        :param region: region name
+        :param compartments: OCIDs of the scanned compartments. None for all the region
+        """
+        with self._lock:
+            if compartments is None:
+                self._nested.pop(region, None)
+                self._parents.pop(region, None)
+                return
+            compartments = set(compartments)
+            nested, parents = self._nested.get(region, {}), self._parents.get(region, {})
+            for parent_id in list(nested):
+                dependencies = nested[parent_id]
+                for nested_id in [i for i, res in dependencies.items() if res.compartment in compartments]:
+                    del dependencies[nested_id]
+                    parents[nested_id].discard(parent_id)
+                    if not parents[nested_id]:
+                        del parents[nested_id]
+                if not dependencies:
+                    del nested[parent_id]
+
+    def get_dependencies(self, id):
+        """
+        :return: list of the resources registered as nested dependencies of id
+        """
+        with self._lock:
+            return [res for nested in self._nested.values() for res in nested.get(id, {}).values()]
+
+    def get_dependents(self, id):
+        """
+        :return: set of the OCIDs of the resources id is registered as nested dependency of
+        """
+        with self._lock:
+            return {parent_id for parents in self._parents.values() for parent_id in parents.get(id, ())}
+
+    def add_preserved(self, region, scope, res):
+        """
+        register a preserved resource skipped by the discovery.
+        The cleanup can't terminate the resources it depends on
+
+        :param region: region name
+        :param scope: OCID of the compartment whose scan found the resource
+        :param res: preserved resource
+        """
+        with self._lock:
+            self._preserved.setdefault(region, {}).setdefault(scope, {})[res.id] = res
+
+    def clear_preserved(self, region, scopes):
+        """
+        drop the preserved resources found by the scan of the scopes, before scanning them again
+
+        :param region: region name
+        :param scopes: OCIDs of the scanned compartments
+        """
+        with self._lock:
+            preserved = self._preserved.get(region, {})
+            for scope in scopes:
+                preserved.pop(scope, None)
+
+    def preserved(self, region):
+        """
+        :param region: region name
+        :return: list of (scope, resource) of the preserved resources skipped by the discovery
+        """
+        with self._lock:
+            return [(scope, res) for scope, resources in self._preserved.get(region, {}).items()
+                    for res in resources.values()]
+
+    def clear(self):
+        with self._lock:
+            for res in self._resources.values():
+                if res._registry is self:
+                    res._registry = None
+            self._resources.clear()
+            self._positions.clear()
+            for index in self._indexes.values():
+                index.clear()
+            self._nested.clear()
+            self._parents.clear()
+            self._preserved.clear()
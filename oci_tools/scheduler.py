@@ -0,0 +1,273 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import RESOURCE as R
+from .resource_registry import DESCRIPTORS
+from .wait_engine import wait_engine
+
+# type level rules: within the same compartment, the resources of the key type
+# must be terminated before the resources of the listed types, see ResourceDescriptor.dependencies
+TYPE_DEPENDENCIES = {t: d.dependencies for t, d in DESCRIPTORS.items() if d.dependencies}
+
+# resource type -> attributes referencing resources that can be terminated only after the current one,
+# see ResourceDescriptor.references
+REFERENCE_ATTRIBUTES = {t: d.references for t, d in DESCRIPTORS.items() if d.references}
+# resource type -> attributes referencing resources that can't be terminated while the current one exists:
+# the references and the parent, e.g. the instance of a preserved vnic attachment
+PRESERVE_REFERENCE_ATTRIBUTES = {
+    t: d.references + ((d.parent_attribute,) if d.parent_type not in (None, R.COMPARTMENT) else ())
+    for t, d in DESCRIPTORS.items()}
+
+# maximum number of threads submitting the terminations
+SUBMIT_THREADS = 8
+# seconds between two liveness checks of the wait engine while the terminations are pending
+LIVENESS_CHECK_INTERVAL = 60
+
+class CleanupPlan:
+    """
+    dependency graph of the resources to terminate.
+    An edge A -> B means that A must be terminated before B.
+    Independent resources are terminated concurrently.
+    """
+
+    def __init__(self, engine=None):
+        """
+        :param engine: WaitEngine tracking the terminations. Default: the shared wait_engine
+        """
+        self._engine = engine if engine is not None else wait_engine
+        self._nodes = {}
+        self._scopes = {}
+        self._kwargs = {}
+        self._before = {}
+        self._after = {}
+        # dependencies whose failure doesn't prevent the termination of the dependent resource
+        self._optional = set()
+        self._preserved = []
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, res_id):
+        return res_id in self._nodes
+
+    def add(self, res, scope=None, **terminate_kwargs):
+        """
+        add a resource to the plan
+
+        :param res: OciResource to terminate
+        :param scope: scope of the type level rules, usually the compartment OCID
+        :param terminate_kwargs: arguments passed to the resource terminate
+        """
+        self._nodes.setdefault(res.id, res)
+        self._scopes[res.id] = scope
+        self._kwargs[res.id] = terminate_kwargs
+        self._before.setdefault(res.id, set())
+        self._after.setdefault(res.id, set())
+
+    def add_dependency(self, first, then, optional=False):
+        """
+        terminate first before then. Dependencies on resources not in the plan are ignored
+
+        :param first: OCID of the resource to terminate first
+        :param then: OCID of the resource to terminate after first
+        :param optional: then is terminated even if the termination of first fails
+        """
+        if first in self._nodes and then in self._nodes and first != then:
+            self._after[first].add(then)
+            self._before[then].add(first)
+            if optional:
+                self._optional.add((first, then))
+            else:
+                self._optional.discard((first, then))
+
+    def add_preserved(self, res):
+        """
+        register a resource not included in the plan that is going to survive the run,
+        e.g. a preserved resource skipped by the discovery or a resource not terminated by a previous plan.
+        The resources it depends on are removed from the plan before the run
+
+        :param res: OciResource that is not terminated
+        """
+        self._preserved.append(res)
+
+    def _prune_preserved(self, preserve_policy):
+        """
+        remove from the plan the preserved resources and the upward closure of the resources they depend on
+        (referenced resources, injected parents and compartments): their termination is bound to fail.
+        The type level rules only define the termination order and they are not followed
+
+        :param preserve_policy: PreservePolicy of the resources to preserve
+        :return: list of the removed resources
+        """
+        preserved = {res_id for res_id, res in self._nodes.items() if res.check_tags(preserve_policy)}
+        closure = set()
+        for res in self._preserved + [self._nodes[res_id] for res_id in preserved]:
+            stack = list(_ancestors(res))
+            while stack:
+                ancestor = stack.pop()
+                if ancestor in self._nodes and ancestor not in closure:
+                    closure.add(ancestor)
+                    ancestor = self._nodes[ancestor]
+                    # the content of a compartment doesn't depend on the compartment
+                    stack.extend(_ancestors(ancestor, nested=ancestor.resource_type != R.COMPARTMENT))
+
+        removed = []
+        for res_id in [res_id for res_id in self._nodes if res_id in preserved or res_id in closure]:
+            res = self._nodes.pop(res_id)
+            logging.info('::: skip {} {} [{}]'.format(res.resource_type, res.name,
+                                                      'preserved' if res_id in preserved else 'preserved dependency'))
+            for first in self._before.pop(res_id):
+                self._after[first].discard(res_id)
+            for then in self._after.pop(res_id):
+                self._before[then].discard(res_id)
+            del self._scopes[res_id], self._kwargs[res_id]
+            removed.append(res)
+        return removed
+
+    def _resolve_dependencies(self):
+        """
+        add the dependencies inferred from type level rules, registry nested dependencies
+        and resource references
+        """
+        by_scope = {}
+        for res_id, res in self._nodes.items():
+            by_scope.setdefault((self._scopes[res_id], res.resource_type), []).append(res_id)
+
+        for (scope, res_type), ids in by_scope.items():
+            for then_type in TYPE_DEPENDENCIES.get(res_type, ()):
+                for then in by_scope.get((scope, then_type), []):
+                    for first in ids:
+                        self.add_dependency(first, then)
+
+        for res_id, res in self._nodes.items():
+            for nested in res.nested_dependencies():
+                self.add_dependency(nested.id, res_id)
+                # e.g. a vnic attachment not in the plan: its instance must be terminated first
+                self.add_dependency(nested.reference('instance_id'), res_id)
+            for ref in _references(res, REFERENCE_ATTRIBUTES):
+                self.add_dependency(res_id, ref)
+
+    def run(self, simulate=False, preserve_policy=None, workers=1):
+        """
+        terminate the resources following the dependency graph.
+        A resource is submitted as soon as all its dependencies are terminated,
+        the resources depending on a failed termination are skipped.
+        The submitted terminations are tracked by the wait engine, so the
+        threads are busy only while calling the delete api
+
+        :param simulate: simulate the termination
+        :param preserve_policy: PreservePolicy of the resources to preserve
+        :param workers: maximum number of terminations in progress
+        :return: (list of terminated resources, list of resources not terminated)
+        """
+        self._resolve_dependencies()
+        failed = self._prune_preserved(preserve_policy)
+
+        workers = max(workers, 1)
+        pending = {res_id: len(before) for res_id, before in self._before.items()}
+        ready = [res_id for res_id, count in pending.items() if count == 0]
+        done = []
+
+        def _release(then):
+            if then in pending:
+                pending[then] -= 1
+                if pending[then] == 0:
+                    ready.append(then)
+
+        def _skip(res_id):
+            for then in self._after[res_id]:
+                if (res_id, then) in self._optional:
+                    _release(then)
+                elif pending.pop(then, None) is not None:
+                    res = self._nodes[then]
+                    logging.info('::: skip {} {} [dependency not terminated]'.format(res.resource_type, res.name))
+                    failed.append(res)
+                    _skip(then)
+
+        with ThreadPoolExecutor(max_workers=min(workers, SUBMIT_THREADS)) as executor:
+            # future -> resource id. The future is either the submission or the termination
+            running = {}
+            # futures of the terminations tracked by the wait engine
+            tracked = set()
+            while ready or running:
+                while ready and len(running) < workers:
+                    res_id = ready.pop(0)
+                    pending.pop(res_id, None)
+                    running[executor.submit(self._nodes[res_id].submit_terminate,
+                                            simulate,
+                                            preserve_policy,
+                                            engine=self._engine,
+                                            **self._kwargs[res_id])] = res_id
+
+                completed, _ = wait(running, timeout=LIVENESS_CHECK_INTERVAL, return_when=FIRST_COMPLETED)
+                if not completed and not self._engine.is_alive():
+                    # nobody is going to resolve the tracked terminations: fail them
+                    logging.error('wait engine stopped, unable to check {} terminations'.format(len(tracked)))
+                    for future in tracked:
+                        if not future.done():
+                            future.set_result(False)
+                    continue
+                for future in completed:
+                    res_id = running.pop(future)
+                    tracked.discard(future)
+                    res = self._nodes[res_id]
+                    try:
+                        terminated = future.result()
+                    except Exception as e:
+                        logging.error(str(e))
+                        terminated = False
+
+                    if isinstance(terminated, Future):
+                        # submitted, wait for the termination
+                        running[terminated] = res_id
+                        tracked.add(terminated)
+                        continue
+
+                    if not terminated:
+                        failed.append(res)
+                        _skip(res_id)
+                        continue
+
+                    done.append(res)
+                    for then in self._after[res_id]:
+                        _release(then)
+
+        for res_id in pending:
+            # unresolved dependency cycle
+            res = self._nodes[res_id]
+            logging.error(':: unable to schedule {} {} [dependency cycle]'.format(res.resource_type, res.name))
+            failed.append(res)
+
+        return done, failed
+
+
+def _ancestors(res, nested=True):
+    """
+    :param res: OciResource
+    :param nested: include the ancestors of the resources nested in res
+    :return: generator of the OCIDs of the resources that can't be terminated while res exists
+    """
+    yield res.compartment
+    yield from _references(res, PRESERVE_REFERENCE_ATTRIBUTES)
+    yield from res.dependency_parents()
+    if not nested:
+        return
+    # the nested resources are kept with res, e.g. the vnic attachments of an instance
+    for items in res.values():
+        if isinstance(items, list):
+            for item in items:
+                yield from _ancestors(item)
+
+
+def _references(res, attributes):
+    """
+    :param res: OciResource
+    :param attributes: resource type -> referencing attributes, REFERENCE_ATTRIBUTES or PRESERVE_REFERENCE_ATTRIBUTES
+    :return: generator of the OCIDs referenced by res
+    """
+    for attr in attributes.get(res.resource_type, ()):
+        value = res.reference(attr)
+        if isinstance(value, tuple):
+            yield from value
+        elif value:
+            yield value
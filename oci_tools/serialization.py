@@ -0,0 +1,174 @@
+import datetime
+import importlib
+import re
+
+import pytz
+from dateutil import parser as date_parser
+from oci.util import to_dict, NONE_SENTINEL
+
+# model class -> tuple of (attribute name, instance attribute, converter)
+_MODEL_FIELDS = {}
+# model class -> tuple of (attribute name, instance attribute, decoder)
+_MODEL_DECODERS = {}
+
+_LIST_TYPE = re.compile(r'^list\[(.+)\]$')
+_DICT_TYPE = re.compile(r'^dict\(str, (.+)\)$')
+_PRIMITIVE_TYPES = ('str', 'int', 'float', 'bool')
+
+
+def model_to_dict(model):
+    """
+    convert an SDK model into a dict. Same result of oci.util.to_dict
+    without inspecting every value: the attributes and their converters are computed once per model class
+    from the model swagger_types
+
+    :param model: OCI SDK model
+    :return: dict
+    """
+    fields = _MODEL_FIELDS.get(type(model))
+    if fields is None:
+        fields = _MODEL_FIELDS[type(model)] = _model_fields(model)
+    values = model.__dict__
+    r = {}
+    for name, attr, convert in fields:
+        value = values[attr] if attr in values else getattr(model, name)
+        if value is None or value is NONE_SENTINEL:
+            r[name] = None
+        else:
+            r[name] = convert(value) if convert else value
+    return r
+
+
+def _model_fields(model):
+    return tuple((name, '_{}'.format(name), _converter(swagger_type))
+                 for name, swagger_type in model.swagger_types.items())
+
+
+def _converter(swagger_type):
+    """
+    :return: function converting a value of the swagger type, None if the value is used as is
+    """
+    if swagger_type in _PRIMITIVE_TYPES:
+        return None
+    if swagger_type == 'datetime':
+        return _datetime_to_str
+    if swagger_type == 'date':
+        return _date_to_str
+    list_type = _LIST_TYPE.match(swagger_type)
+    if list_type:
+        item_converter = _converter(list_type.group(1)) or _primitive
+        return lambda value: [item_converter(v) for v in value]
+    dict_type = _DICT_TYPE.match(swagger_type)
+    if dict_type:
+        value_converter = _converter(dict_type.group(1)) or _primitive
+        return lambda value: {k: value_converter(v) for k, v in value.items()}
+    if swagger_type == 'object':
+        return to_dict
+    return _model
+
+
+def _primitive(value):
+    return None if value is NONE_SENTINEL else value
+
+
+def _model(value):
+    # the declared type can be the base class of a polymorphic model
+    return model_to_dict(value) if hasattr(value, 'swagger_types') else to_dict(value)
+
+
+def _datetime_to_str(value):
+    if not isinstance(value, datetime.datetime):
+        return to_dict(value)
+    if not value.tzinfo:
+        value = pytz.utc.localize(value)
+    return value.isoformat(sep='T')
+
+
+def _date_to_str(value):
+    if not isinstance(value, datetime.date):
+        return to_dict(value)
+    return value.isoformat()
+
+
+def dict_to_model(model_class, data):
+    """
+    rebuild an SDK model from the dict returned by model_to_dict.
+    The attributes and their decoders are computed once per model class from the model swagger_types
+
+    :param model_class: SDK model class
+    :param data: dict
+    :return: SDK model
+    """
+    decoders = _MODEL_DECODERS.get(model_class)
+    if decoders is None:
+        decoders = _MODEL_DECODERS[model_class] = _model_decoders(model_class)
+    model = model_class()
+    values = model.__dict__
+    for name, attr, decode in decoders:
+        value = data.get(name)
+        values[attr] = decode(value) if decode and value is not None else value
+    return model
+
+
+def model_class_name(model_class):
+    """
+    :return: qualified name of the SDK model class, as accepted by model_class_by_name
+    """
+    return '{}.{}'.format(model_class.__module__, model_class.__name__)
+
+
+def model_class_by_name(name):
+    """
+    :param name: qualified name of the SDK model class
+    :return: SDK model class
+    """
+    module, _, class_name = name.rpartition('.')
+    return getattr(importlib.import_module(module), class_name)
+
+
+def _model_decoders(model_class):
+    # swagger_types is set by the model constructor
+    swagger_types = model_class().swagger_types
+    models = importlib.import_module(model_class.__module__.rpartition('.')[0])
+    return tuple((name, '_{}'.format(name), _decoder(swagger_type, models))
+                 for name, swagger_type in swagger_types.items())
+
+
+def _decoder(swagger_type, models):
+    """
+    :param models: SDK models package of the model owning the attribute
+    :return: function decoding a value of the swagger type, None if the value is used as is
+    """
+    if swagger_type in _PRIMITIVE_TYPES or swagger_type == 'object':
+        return None
+    if swagger_type == 'datetime':
+        return date_parser.parse
+    if swagger_type == 'date':
+        return lambda value: date_parser.parse(value).date()
+    list_type = _LIST_TYPE.match(swagger_type)
+    if list_type:
+        item_decoder = _decoder(list_type.group(1), models)
+        if not item_decoder:
+            return None
+        return lambda value: [item_decoder(v) if v is not None else None for v in value]
+    dict_type = _DICT_TYPE.match(swagger_type)
+    if dict_type:
+        value_decoder = _decoder(dict_type.group(1), models)
+        if not value_decoder:
+            return None
+        return lambda value: {k: value_decoder(v) if v is not None else None for k, v in value.items()}
+
+    model_class = getattr(models, swagger_type, None)
+    if model_class is None:
+        return None
+    if not hasattr(model_class, 'get_subtype'):
+        return lambda value: dict_to_model(model_class, value)
+
+    # polymorphic model: the subtype is selected from the wire representation of the discriminator
+    attribute_map = model_class().attribute_map
+
+    def _decode_subtype(value):
+        subtype = model_class.get_subtype({attribute_map.get(k, k): v for k, v in value.items()})
+        return dict_to_model(getattr(models, subtype, model_class), value)
+
+    return _decode_subtype
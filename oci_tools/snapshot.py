@@ -0,0 +1,223 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from . import oci_resources
+from .oci_config import OCIConfig
+from .oci_resources import OciResource
+from .serialization import dict_to_model, model_class_name, model_class_by_name
+
+# bumped when the layout of the tables or of the stored resources changes: older stores are dropped
+_SCHEMA_VERSION = 3
+_TABLES = ('snapshot', 'resource', 'dependency', 'preserved')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS snapshot (
+    tenancy TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    region TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    PRIMARY KEY (tenancy, profile, region)
+);
+CREATE TABLE IF NOT EXISTS resource (
+    tenancy TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    region TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    parent_id TEXT,
+    compartment_id TEXT,
+    resource_class TEXT NOT NULL,
+    client_class TEXT NOT NULL,
+    model_class TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (tenancy, profile, region, position)
+);
+CREATE INDEX IF NOT EXISTS resource_compartment ON resource (tenancy, profile, region, compartment_id);
+CREATE TABLE IF NOT EXISTS dependency (
+    tenancy TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    region TEXT NOT NULL,
+    parent_id TEXT NOT NULL,
+    nested_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dependency_region ON dependency (tenancy, profile, region);
+CREATE TABLE IF NOT EXISTS preserved (
+    tenancy TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    region TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    resource_class TEXT NOT NULL,
+    client_class TEXT NOT NULL,
+    model_class TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+'''
+
+
+def _walk(tree: OciResource, parent_id=None, compartment_id=None):
+    """
+    visit the tree in pre-order
+
+    :return: generator of (resource, parent OCID, OCID of the compartment the resource was discovered in)
+    """
+    yield tree, parent_id, compartment_id
+    nested_compartment_id = tree.id if isinstance(tree, oci_resources.OciCompartment) else compartment_id
+    for items in tree.values():
+        if isinstance(items, list):
+            for nested in items:
+                yield from _walk(nested, tree.id, nested_compartment_id)
+
+
+class SnapshotStore:
+    """
+    SQLite store of the discovered compartment trees.
+    A snapshot is kept per tenancy, profile and region and it is valid for snapshot_ttl seconds
+    and as long as the settings affecting the discovery don't change
+    """
+
+    def __init__(self, conf: OCIConfig):
+        self._conf = conf
+        self._path = os.path.join(conf.cache_dir, 'snapshots.db')
+        self._key = (conf.tenancy, conf.profile)
+
+    def _connect(self):
+        os.makedirs(self._conf.cache_dir, exist_ok=True)
+        connection = sqlite3.connect(self._path)
+        if connection.execute('PRAGMA user_version').fetchone()[0] != _SCHEMA_VERSION:
+            with connection:
+                for table in _TABLES:
+                    connection.execute('DROP TABLE IF EXISTS {}'.format(table))
+                connection.execute('PRAGMA user_version = {}'.format(_SCHEMA_VERSION))
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def _settings(self):
+        """
+        fingerprint of the settings affecting the discovery
+        """
+        conf = self._conf
+        settings = [conf.compartment_filter, conf.compartment_filter_toplevel_only, conf.preserve_compartments,
+                    conf.preserve_tags, conf.skip_scan_preserved_resources]
+        return hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def timestamp(self, region, max_age=None):
+        """
+        :param region: region name
+        :param max_age: maximum age in seconds of the snapshot. Default: snapshot_ttl
+        :return: time of the region snapshot or None if it's missing, expired or taken with different settings
+        """
+        max_age = self._conf.snapshot_ttl if max_age is None else max_age
+        if self._conf.snapshot_ttl <= 0 or not os.path.exists(self._path):
+            return None
+        try:
+            with closing(self._connect()) as connection:
+                row = connection.execute('SELECT settings, timestamp FROM snapshot '
+                                         'WHERE tenancy = ? AND profile = ? AND region = ?',
+                                         (*self._key, region)).fetchone()
+        except sqlite3.Error as e:
+            logging.warning('unable to read snapshot store: {}'.format(e))
+            return None
+        if not row or row[0] != self._settings() or time.time() - row[1] > max_age:
+            return None
+        return row[1]
+
+    def save(self, region, trees, registry, timestamp=None):
+        """
+        replace the region snapshot
+
+        :param region: region name
+        :param trees: list of compartment trees
+        :param registry: ResourceRegistry of the discovery, holding the preserved resources
+        :param timestamp: time of the discovery. Default: now
+        """
+        if self._conf.snapshot_ttl <= 0:
+            return
+        resources, dependencies, saved = [], set(), {}
+        for tree in trees:
+            for res, parent_id, compartment_id in _walk(tree):
+                saved[res.id] = res
+                resources.append((*self._key, region, len(resources), res.id, parent_id, compartment_id,
+                                  type(res).__name__,
+                                  type(res.api_client).__name__,
+                                  model_class_name(res.model_class),
+                                  res.blob))
+        for res_id, res in saved.items():
+            for nested in registry.get_dependencies(res_id):
+                if nested.id in saved:
+                    dependencies.add((*self._key, region, res_id, nested.id))
+        # preserved resources skipped by the discovery
+        preserved = [(*self._key, region, scope, type(res).__name__, type(res.api_client).__name__,
+                      model_class_name(res.model_class), res.blob)
+                     for scope, res in registry.preserved(region)]
+        try:
+            with closing(self._connect()) as connection, connection:
+                self._delete(connection, region)
+                connection.executemany('INSERT INTO resource VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', resources)
+                connection.executemany('INSERT INTO dependency VALUES (?, ?, ?, ?, ?)', dependencies)
+                connection.executemany('INSERT INTO preserved VALUES (?, ?, ?, ?, ?, ?, ?, ?)', preserved)
+                connection.execute('INSERT INTO snapshot VALUES (?, ?, ?, ?, ?)',
+                                   (*self._key, region, self._settings(), timestamp or time.time()))
+        except sqlite3.Error as e:
+            logging.warning('unable to write snapshot store: {}'.format(e))
+
+    def load(self, region, clients, registry):
+        """
+        rebuild the region compartment trees
+
+        :param region: region name
+        :param clients: dict client class name -> OCI API client of the region
+        :param registry: ResourceRegistry the dependencies and the preserved resources are registered in
+        :return: list of compartment trees
+        """
+        objects, trees = {}, []
+        registry.clear_dependencies(region)
+
+        def _resource(resource_class, client_class, model_class, data):
+            model = dict_to_model(model_class_by_name(model_class), json.loads(data))
+            return getattr(oci_resources, resource_class)(model, clients[client_class])
+
+        with closing(self._connect()) as connection:
+            rows = connection.execute('SELECT id, parent_id, resource_class, client_class, model_class, data '
+                                      'FROM resource WHERE tenancy = ? AND profile = ? AND region = ? '
+                                      'ORDER BY position', (*self._key, region))
+            for res_id, parent_id, *record in rows:
+                res = _resource(*record)
+                objects[res_id] = res
+                if parent_id is None:
+                    trees.append(res)
+                else:
+                    objects[parent_id].append(res)
+            for parent_id, nested_id in connection.execute('SELECT parent_id, nested_id FROM dependency '
+                                                           'WHERE tenancy = ? AND profile = ? AND region = ?',
+                                                           (*self._key, region)):
+                registry.set_dependency(region, parent_id, objects[nested_id])
+            for scope, *record in connection.execute('SELECT scope, resource_class, client_class, model_class, data '
+                                                     'FROM preserved WHERE tenancy = ? AND profile = ? AND region = ?',
+                                                     (*self._key, region)):
+                registry.add_preserved(region, scope, _resource(*record))
+        return trees
+
+    def invalidate(self, region):
+        """
+        drop the region snapshot
+
+        :param region: region name
+        """
+        if not os.path.exists(self._path):
+            return
+        try:
+            with closing(self._connect()) as connection, connection:
+                self._delete(connection, region)
+        except sqlite3.Error as e:
+            logging.warning('unable to write snapshot store: {}'.format(e))
+
+    def _delete(self, connection, region):
+        for table in _TABLES:
+            connection.execute('DELETE FROM {} WHERE tenancy = ? AND profile = ? AND region = ?'.format(table),
+                               (*self._key, region))
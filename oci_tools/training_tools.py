@@ -1,36 +1,41 @@
 
-import yaml
 import sys
+import time
+import datetime
+import multiprocessing
+import logging.handlers
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from distutils.util import strtobool
 
 
 from .oci_resources import *
+from .oci_config import OCIConfig
 
 from oci_tools import RESOURCE as R
 from oci_tools import REGIONS
-
-from oci.exceptions import ServiceError
-
-compute_client: oci.core.ComputeClient = None
-network_client: oci.core.VirtualNetworkClient = None
-bv_client: oci.core.BlockstorageClient = None
-identity_client: oci.identity.IdentityClient = None
-lb_client: oci.load_balancer.LoadBalancerClient = None
-db_client: oci.database.DatabaseClient = None
-
-
-def _init_api_client(conf: OCIConfig):
-    global compute_client
-    global network_client
-    global bv_client
-    global lb_client
-    global db_client
-
-    lb_client = oci.load_balancer.LoadBalancerClient(conf.config)
-    network_client = oci.core.VirtualNetworkClient(conf.config)
-    compute_client = oci.core.ComputeClient(conf.config)
-    bv_client = oci.core.BlockstorageClient(conf.config)
-    db_client = oci.database.DatabaseClient(conf.config)
+from oci_tools import cache
+from .scheduler import CleanupPlan
+from .snapshot import SnapshotStore
+from .resource_registry import DESCRIPTORS, NESTED_TYPES
+from .oci_resources import RESOURCE_CLASSES
+from .output import open_writer
+from .context import RegionContext, Scan
+from . import listing
+
+# audit events are kept for 90 days by default
+AUDIT_RETENTION = 90 * 86400
+# audit events can be recorded a few minutes after the event time
+AUDIT_DELAY = 900
+AUDIT_READ_ACTIONS = ('GET', 'HEAD')
+
+# connection and read timeouts in seconds of the region subscriptions probes: the probes of the
+# unreachable regions must end, the interpreter waits for their threads before exiting
+PROBE_TIMEOUT = (5, 10)
+
+# database editions supporting Data Guard
+DATA_GUARD_EDITIONS = ('ENTERPRISE_EDITION',
+                       'ENTERPRISE_EDITION_HIGH_PERFORMANCE',
+                       'ENTERPRISE_EDITION_EXTREME_PERFORMANCE')
 
 
 def run(config: OCIConfig):
@@ -40,14 +45,14 @@ def run(config: OCIConfig):
     if config.operation == 'destory':
         logging.error('sorry destroy operation is not implemented yet')
 
-   # scan_tenancy(config)
+    scan = scan_tenancy(config)
     # currently cleanup and terminate-all are equivalent
     
     question = 'WARNING cleanup operation will terminate all the resources according with the configuration you have provided. \nThis operation can not be undone. Do you want to proceed?'
     if config.operation ==  'dryrun' or \
         (config.operation == 'cleanup' and  (config.auto_approve or \
                                                 _prompt(question))):
-        cleanup(config)
+        cleanup(scan)
 
 def _prompt(question):
     sys.stdout.write('{} [y/n]: '.format(question))
@@ -61,50 +66,226 @@ def _prompt(question):
 def scan_tenancy(config: OCIConfig):
     """
     Scan the tenancy by compartments
+    the output of every region is written as soon as the region is scanned
 
     :param config: OCIConfig object
+    :return: Scan with the discovered resources
     """
-    compartment_list(config)
-    resource_list(config)
-    json_structure = get_json(config)
-    
-    if config.use_yaml_format:
-        output = yaml.dump(json_structure, indent=3, sort_keys=True)
-    else:
-        output = json.dumps(json_structure, indent=3, sort_keys=True)
-
-    logging.info('{}'.format(output))
-    if(config.print_to_file):
-        with open(config.output_file, 'w') as output_file:
-            output_file.write(output)
+    scan = Scan(config)
+    with open_writer(config) as writer:
+        if (config.use_snapshot and snapshot_load(scan) or
+                config.refresh_snapshot and snapshot_refresh(scan)):
+            for r, trees in scan.trees.items():
+                writer.write_region(r, trees)
+        else:
+            compartment_list(scan)
+            resource_list(scan, on_region=writer.write_region)
+            snapshot_save(scan)
+    return scan
+
+
+def discover(config: OCIConfig):
+    """
+    discover the resources of the subscribed regions, without writing any output
 
+    :param config: OCIConfig object
+    :return: Scan with the discovered resources, scan.trees is the dict region -> list of compartment trees
+    """
+    if config.region_subscriptions is None:
+        get_regions(config)
+    scan = Scan(config)
+    compartment_list(scan)
+    resource_list(scan)
+    return scan
 
 
-def cleanup(config: OCIConfig, force=False):
+def cleanup(scan: Scan, force=False):
     """
     Clean up operations
-    TODO: currently the cleanup operation follow the compartment tree. It should take in consideration the dependency tree
+    the resources of the regions are terminated concurrently, the resources of every region following the
+    dependency graph built by CleanupPlan.
+    Compartments are global resources and they can be deleted only when empty in every region:
+    they are deleted from the home region once all the regions are cleaned up, bottom-up with the
+    sibling compartments deleted in parallel
 
-    :param config: OCIConfig object
+    :param scan: Scan returned by the discovery
     :param force: terminate also the top level compartment [not used]
+    :return: dict region -> (list of terminated resources, list of resources not terminated).
+    The compartments are reported in the home region
     """
-
-    for r in config.compartments_tree.keys():
-        # logging.info(r)
-        config.workon_region = r
+    config = scan.conf
+    regions = list(scan.trees.keys())
+    if not regions:
+        return {}
+    # the compartment trees are the same in every region
+    home = config.home_region if config.home_region in scan.trees else regions[0]
+
+    plans = {}
+    compartment_plan = CleanupPlan(scan.wait_engine)
+    for r in regions:
+        ctx = scan.context(r)
+        plan = plans[r] = CleanupPlan(scan.wait_engine)
+        for _, res in scan.registry.preserved(r):
+            plan.add_preserved(res)
+            compartment_plan.add_preserved(res)
+        # the resources not terminated keep their compartments in every region
+        for t in OciCompartment.KEPT_RESOURCE_TYPES:
+            for res in scan.registry.query(r, resource_type=t):
+                compartment_plan.add_preserved(res)
+        for tree in scan.trees[r]:
+            tree.cleanup(config=ctx, force=force, plan=plan,
+                         compartment_plan=compartment_plan if r == home else None)
+
+    def _run(r):
         logging.info("Clean-up resources in {} region".format(r))
+        return plans[r].run(config.simulate_deletion, scan.preserve_policy, config.cleanup_workers)
+
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        results = dict(zip(regions, executor.map(_run, regions)))
+
+    # the compartments still holding resources in any region are kept
+    for _, failed in results.values():
+        for res in failed:
+            compartment_plan.add_preserved(res)
+    if len(compartment_plan):
+        logging.info("Clean-up compartments in {} region".format(config.home_region or home))
+        # compartment deletions take minutes: all the compartments ready are submitted at once
+        done, failed = compartment_plan.run(config.simulate_deletion, scan.preserve_policy,
+                                            max(config.cleanup_workers, len(compartment_plan)))
+        results[home] = (results[home][0] + done, results[home][1] + failed)
+
+    if not config.simulate_deletion:
+        # the inventory is changed
+        store = SnapshotStore(config)
+        for r in regions:
+            store.invalidate(r)
+    return results
+
+
+def snapshot_save(scan: Scan):
+    """
+    store the discovered compartment trees in the snapshot store
+
+    :param scan: Scan returned by the discovery
+    """
+    store = SnapshotStore(scan.conf)
+    for r, trees in scan.trees.items():
+        store.save(r, trees, scan.registry)
+
+
+def snapshot_load(scan: Scan):
+    """
+    load the compartment trees from the snapshot store
+
+    :param scan: Scan the snapshot is loaded into
+    :return: True if a valid snapshot is available for every region
+    """
+    store = SnapshotStore(scan.conf)
+    regions = [r.region_name for r in scan.conf.region_subscriptions]
+    if any(store.timestamp(r) is None for r in regions):
+        logging.info('No valid snapshot available, scanning the tenancy')
+        return False
+
+    scan.trees = _snapshot_trees(scan, store, regions)
+    return True
+
+
+def snapshot_refresh(scan: Scan):
+    """
+    incremental refresh of the snapshot: only the compartments with create, update or delete activity
+    recorded by Audit since the snapshot was taken are scanned again.
+    The resources of the other compartments are taken from the snapshot
+
+    :param scan: Scan the refreshed snapshot is loaded into
+    :return: True if the snapshot of every region has been refreshed
+    """
+    store = SnapshotStore(scan.conf)
+    regions = [r.region_name for r in scan.conf.region_subscriptions]
+    since = {r: store.timestamp(r, max_age=AUDIT_RETENTION) for r in regions}
+    if any(t is None for t in since.values()):
+        logging.info('No snapshot to refresh, scanning the tenancy')
+        return False
+
+    started = time.time()
+    snapshot_tree = _snapshot_trees(scan, store, regions)
+    # the compartment hierarchy is always retrieved, it's a single call
+    compartment_list(scan)
+
+    changed = {}
+    for r in regions:
+        ctx = scan.context(r)
+        known = {c.id: c for c in _compartments_to_scan(ctx, snapshot_tree[r], verbose=False)}
+        to_scan = _compartments_to_scan(ctx, scan.trees[r], verbose=False)
+        # compartments moved or not in the snapshot are scanned anyway
+        changed[r] = {c.id for c in to_scan if c.id not in known} | _audited_compartments(ctx, to_scan, since[r])
+        logging.info('{}: {} of {} compartments changed since {}'.format(
+            r, len(changed[r]), len(to_scan), datetime.datetime.fromtimestamp(since[r]).isoformat(' ', 'seconds')))
+
+        for compartment in to_scan:
+            if compartment.id not in changed[r]:
+                for res_type, items in known[compartment.id].items():
+                    if res_type != R.COMPARTMENT and isinstance(items, list):
+                        compartment[res_type] = items
+
+    resource_list(scan, changed)
+
+    for r, trees in scan.trees.items():
+        store.save(r, trees, scan.registry, timestamp=started)
+    return True
+
+
+def _audited_compartments(ctx: RegionContext, compartments, since):
+    """
+    find the compartments with create, update or delete Audit events
+
+    :param ctx: RegionContext object
+    :param compartments: compartments to check
+    :param since: time of the last scan
+    :return: set of the OCIDs of the changed compartments
+    """
+    start_time = datetime.datetime.fromtimestamp(since - AUDIT_DELAY, tz=datetime.timezone.utc)
+    end_time = datetime.datetime.now(tz=datetime.timezone.utc)
+
+    def _changed(compartment):
+        try:
+            events = oci.pagination.list_call_get_all_results(ctx.audit_client.list_events,
+                                                              compartment.id,
+                                                              start_time,
+                                                              end_time)
+        except oci.exceptions.ServiceError as se:
+            logging.warning('unable to read the audit events of compartment {}: {}'.format(compartment.name,
+                                                                                          se.message))
+            return True
+        return any(not e.data or not e.data.request or e.data.request.action not in AUDIT_READ_ACTIONS
+                   for e in events.data)
+
+    with ThreadPoolExecutor(max_workers=ctx.scan_workers) as executor:
+        return {c.id for c, changed in zip(compartments, executor.map(_changed, compartments)) if changed}
+
+
+def _snapshot_trees(scan: Scan, store: SnapshotStore, regions):
+    """
+    rebuild the compartment trees of the regions from the snapshot store and index them in the scan registry
+
+    :return: dict region -> list of compartment trees
+    """
+    region_tree = {}
+    for r in regions:
+        region_tree[r] = store.load(r, _region_clients(scan.context(r)), scan.registry)
+        scan.registry.index_region(r, region_tree[r])
+        logging.info('Loaded {} snapshot taken at {}'.format(
+            r, datetime.datetime.fromtimestamp(store.timestamp(r, max_age=AUDIT_RETENTION)).isoformat(' ', 'seconds')))
+    return region_tree
 
-        for tree in config.compartments_tree[r]:
-            tree.cleanup(config=config, force=force)
 
-def get_json(config: OCIConfig):
+def get_json(scan: Scan):
     """
         produce envorinment json tree
     """
     j = json.loads('{}')
-    for r in config.compartments_tree.keys():
+    for r in scan.trees.keys():
         j[r]=[]
-        for tree in config.compartments_tree[r]:
+        for tree in scan.trees[r]:
             j[r].append(tree.to_json())
     return j
    
@@ -113,266 +294,623 @@ def get_json(config: OCIConfig):
 def get_regions(conf: OCIConfig):
     """
     discover subscribed regions and home region.
+    the result is cached on disk per tenancy and profile for region_cache_ttl seconds
 
     :param conf: OCI configuration
     :return:
     """
 
-    global identity_client
-    # loop over the full list of regions as we don't know in advance what are the subscribed regions
-    for r in REGIONS:
-        conf.workon_region = r
-        identity_client = oci.identity.IdentityClient(conf.config)
-        try:
-            rs = identity_client.list_region_subscriptions(conf.tenancy)
-            conf.region_subscriptions = rs.data
-            break
-        except ServiceError as se:
-            continue
+    subscriptions = cache.load_region_subscriptions(conf)
+    if subscriptions is None:
+        subscriptions = _probe_region_subscriptions(conf)
+        if subscriptions is None:
+            logging.error('Unable to retrieve the region subscriptions. '
+                          '\nCheck your configuration and run the script again')
+            exit(-1)
+        cache.save_region_subscriptions(conf, subscriptions)
+    conf.region_subscriptions = subscriptions
     logging.info('Home region: {}'.format(conf.home_region))
     logging.info('Regions: {}'.format(conf.region_subscriptions))
 
 
-def compartment_list(conf: OCIConfig):
+def _probe_region_subscriptions(conf: OCIConfig):
+    """
+    query the region subscriptions concurrently from all the known regions
+    as we don't know in advance what are the subscribed regions. The first successful answer wins
+
+    :param conf: OCI configuration
+    :return: region subscriptions or None if every probe failed
+    """
+
+    def _probe(region):
+        client = conf.client_pool.get(oci.identity.IdentityClient, region, timeout=PROBE_TIMEOUT)
+        return client.list_region_subscriptions(conf.tenancy).data
+
+    # the configured region is the most likely to answer
+    regions = [conf.workon_region] if conf.workon_region else []
+    regions += [r for r in REGIONS if r not in regions]
+
+    executor = ThreadPoolExecutor(max_workers=len(regions))
+    try:
+        for future in as_completed([executor.submit(_probe, r) for r in regions]):
+            try:
+                return future.result()
+            except Exception as e:
+                logging.debug('region subscriptions probe failed: {}'.format(e))
+        return None
+    finally:
+        # don't wait for the slower probes, they end within PROBE_TIMEOUT
+        executor.shutdown(wait=False)
+
+
+def compartment_list(scan: Scan):
     """
     list all compartments
+    compartments are global resources: the hierarchy is retrieved once from the home region
+    and a compartment tree is built from it for every subscribed region
 
-    :param conf: OCIConfig object
+    :param scan: Scan the compartment trees are stored in
+    :return: dict region -> list of compartment trees
     """
+    conf = scan.conf
+    hierarchy = compartment_hierarchy(scan.context(conf.home_region))
     region_tree = {}
     for r in conf.region_subscriptions:
-        conf.workon_region = r.region_name
-        region_tree[r.region_name] = compartment_tree_build(conf)
-    conf.compartments_tree = region_tree
+        scan.registry.clear_preserved(r.region_name, [conf.tenancy])
+        region_tree[r.region_name] = compartment_tree_build(scan.context(r.region_name), hierarchy)
+    scan.trees = region_tree
+    return region_tree
 
 
-def compartment_tree_build(conf: OCIConfig):
+def compartment_hierarchy(ctx: RegionContext):
+    """
+    retrieve all the compartments in the tenancy with a single subtree listing.
+    If compartment_filter is matched only against the top level compartments,
+    only the subtrees of the filtered compartments are kept
+
+    :param ctx: RegionContext object
+    :return: dict parent compartment OCID -> list of nested compartments
+    """
+    hierarchy = {}
+    # the subtree listing returns also the deleted compartments, kept for months
+    elems = ctx.list_all(ctx.identity_client.list_compartments,
+                         ctx.tenancy,
+                         compartment_id_in_subtree=True,
+                         active_only=True)
+    for item in elems.data:
+        hierarchy.setdefault(item.compartment_id, []).append(item)
+    if ctx.compartment_filter and ctx.compartment_filter_toplevel_only:
+        return _scoped_compartment_hierarchy(ctx, hierarchy)
+    return hierarchy
+
+
+def _scoped_compartment_hierarchy(ctx: RegionContext, hierarchy):
+    """
+    keep only the subtrees of the compartments in compartment_filter.
+    The filter names are matched against the top level compartments, the OCIDs at any level.
+    The filtered compartments are the top level compartments of the hierarchy
+
+    :param ctx: RegionContext object
+    :param hierarchy: hierarchy of the whole tenancy
+    :return: dict parent compartment OCID -> list of nested compartments
+    """
+    ids = {c for c in ctx.compartment_filter if c.startswith('ocid1.')}
+    roots = {item.id: item for item in hierarchy.get(ctx.tenancy, []) if ctx.preserve_policy.in_filter(item.name)}
+    roots.update((item.id, item) for items in hierarchy.values() for item in items if item.id in ids)
+    if not roots:
+        logging.warning('no top level compartment matches compartment_filter. '
+                        'Set compartment_filter_toplevel_only=false to match the nested compartments')
+
+    scoped = {}
+
+    def _visit(compartment):
+        nested = scoped[compartment.id] = hierarchy.get(compartment.id, [])
+        for item in nested:
+            # a filtered compartment nested in another one is scanned with it
+            roots.pop(item.id, None)
+            _visit(item)
+
+    for compartment in list(roots.values()):
+        if compartment.id not in scoped:
+            _visit(compartment)
+    scoped[ctx.tenancy] = list(roots.values())
+    return scoped
+
+
+def compartment_tree_build(ctx: RegionContext, hierarchy=None):
     """
     build a full compartment tree
+
+    :param ctx: RegionContext of the tree region, the preserved compartments are registered for it
+    :param hierarchy: compartment hierarchy as returned by compartment_hierarchy. If None it's retrieved
     """
-    global identity_client
-    identity_client = oci.identity.IdentityClient(conf.config)
+    if hierarchy is None:
+        hierarchy = compartment_hierarchy(ctx)
+    identity_client = ctx.identity_client
     tree = []
 
-    def _get_nested_resources(api_list_call: identity_client.list_compartments, id: str, tree: []):
+    def _get_nested_resources(id: str, tree: []):
 
-        elems = oci.pagination.list_call_get_all_results(api_list_call, id,compartment_id_in_subtree=False)
-        for item in elems.data:
+        for item in hierarchy.get(id, []):
             compartment = OciCompartment(item, identity_client)
-            if (conf.preserve_compartments and compartment.name in conf.preserve_compartments or
-                    (conf.skip_scan_preserved_resources and compartment.check_tags(conf.preserve_tags))):
+            if (ctx.preserve_policy.is_preserved_name(compartment.name) or
+                    (ctx.skip_scan_preserved_resources and compartment.check_tags(ctx.preserve_policy))):
+                if compartment.is_active():
+                    ctx.registry.add_preserved(ctx.workon_region, ctx.tenancy, compartment)
                 continue
             if not compartment.is_active():
                 continue
-            _get_nested_resources(api_list_call, compartment.id, compartment)
+            _get_nested_resources(compartment.id, compartment)
             tree.append(compartment)
 
-    _get_nested_resources(identity_client.list_compartments, conf.tenancy, tree)
+    _get_nested_resources(ctx.tenancy, tree)
 
     return tree
 
 
-def resource_list(conf: OCIConfig):
+class _ScanBucket(dict):
     """
-    recursively visit all  compartments in all regions and retrieve resources
-
-    :param conf: OCIConfig object
+    collect the resources of a single resource type discovered in a compartment.
+    Buckets are merged into the compartment tree once the scans are completed
+    so that concurrent scans never modify the same tree.
     """
-    def _retrieve_resources_in_compartment(tree, region, traverse_level=1, scan_resources=False):        
-        logging.info('{} {}'.format('__'*traverse_level, tree['name']))
-        items = tree.get(R.COMPARTMENT)
-        for nested_item in [] if not items else items:
-            traverse_level += 1
-            scan = scan_resources or not bool(conf.compartment_filter) or nested_item.name in conf.compartment_filter
-            _retrieve_resources_in_compartment(nested_item, region, traverse_level, scan_resources=scan)
-            traverse_level -= 1
-        if scan_resources:
-            _get_network_resources(tree, conf)
-            _get_bv_resources(tree, conf)
-            _get_instance_resources(tree, conf)
-            _get_lb_resources(tree, conf)
-            _get_db_resources(tree, conf)
-            _get_autonomous_resources(tree, conf)
 
-    for r in conf.compartments_tree.keys():
-        # logging.info(r)
-        conf.workon_region = r
-        logging.info("Resource discovery - visit compartments in {} region".format(r))
-        _init_api_client(conf)
+    def __init__(self, tree):
+        super().__init__({'name': tree['name'], 'id': tree['id']})
+
+    def append(self, res_obj):
+        if res_obj:
+            self.setdefault(res_obj.resource_type, []).append(res_obj)
 
-        # bv_client.list_volumes('').data
-        for tree in conf.compartments_tree[r]:
-            scan = not bool(conf.compartment_filter) or tree.name in conf.compartment_filter
-            _retrieve_resources_in_compartment(tree, r, scan_resources=scan)
+    def merge_into(self, tree):
+        for k, items in self.items():
+            if k not in ['id', 'name']:
+                for res_obj in items:
+                    tree.append(res_obj)
 
 
-def _get_instance_resources(tree: OciResource, conf: OCIConfig):
+def resource_list(scan: Scan, changed=None, on_region=None):
+    """
+    recursively visit all  compartments in all regions and retrieve resources
+    if scan_workers > 1 compartments and resource types are scanned concurrently
+    if scan_processes > 1 the regions are sharded across a process pool, see _sharded_resource_list
+    if discovery is search, a resource type is scanned only in the compartments
+    where Resource Search found resources of that type
+
+    :param scan: Scan with the compartment trees to fill, see compartment_list
+    :param changed: dict region -> set of the OCIDs of the compartments to scan. None to scan all the compartments
+    :param on_region: function called with the region name and its compartment trees once the region is scanned
+    :return: dict region -> list of compartment trees
     """
-    retrieve instances and vnics
+    if scan.conf.scan_processes > 1:
+        return _sharded_resource_list(scan, changed, on_region)
 
-    :param tree: compartment subtree
+    for r in scan.trees.keys():
+        ctx = scan.context(r)
+        _scan_compartments(ctx, _scan_jobs(ctx, changed))
+        _region_scanned(scan, r, on_region)
+    return scan.trees
+
+
+def _scan_jobs(ctx: RegionContext, changed=None):
     """
-    ilist = oci.pagination.list_call_get_all_results(compute_client.list_instances, compartment_id=tree['id'])
+    select the compartments of the region to scan and the resource types to scan in every compartment
 
-    def _get_nested_resources(api_list_call, res: OciResource):
-        try:
-            rlist = oci.pagination.list_call_get_all_results(api_list_call,
-                                                             compartment_id=tree['id'],
-                                                             instance_id=i.id)
-            for r in rlist.data:
-                res_obj = res(r, compute_client)
-                if conf.skip_scan_preserved_resources and res_obj.check_tags(conf.preserve_tags):
-                    continue
-                if not res_obj or not res_obj.is_active():
-                    continue
-                res_obj.append(res_obj)
-                # vcn dependency tree for clean-up operation
-                if isinstance(res_obj, OciVnicAttachment):
-                    # if primary vnic the dependency is on the instance as I can't detach the primary vnic
-                    # else is just the vnic-attachment
-                    vnic_id= res_obj.resource.vnic_id
-                    vnic = network_client.get_vnic(vnic_id)
-                    if vnic.data.is_primary:
-                        OciResource.set_dependency(r.subnet_id, instance)
-                    else:
-                        OciResource.set_dependency(r.subnet_id, res_obj)
-
-        except Exception as e:
-            logging.error('unable to retrieve {} Instance {}'.format(res.resource_type, i.id))
-
-    for i in ilist.data:
-        instance = OciInstance(i, compute_client)
-        if not instance.is_active():
-            continue
-        _get_nested_resources(compute_client.list_vnic_attachments, OciVnicAttachment)
+    :param ctx: RegionContext bound to the scan
+    :param changed: see resource_list
+    :return: list of (compartment, list of SCANNED_TYPES)
+    """
+    logging.info("Resource discovery - visit compartments in {} region".format(ctx.workon_region))
+
+    to_scan = _compartments_to_scan(ctx, ctx.trees)
+    if changed is not None:
+        to_scan = [tree for tree in to_scan if tree.id in changed.get(ctx.workon_region, ())]
+    ctx.registry.clear_preserved(ctx.workon_region, [tree.id for tree in to_scan])
+    ctx.registry.clear_dependencies(ctx.workon_region, [tree.id for tree in to_scan])
+
+    found = _search_resource_types(ctx) if ctx.discovery == 'search' else None
+    if found is None:
+        return [(tree, SCANNED_TYPES) for tree in to_scan]
+
+    searched = set(SEARCH_RESOURCE_TYPES.values())
 
-        tree.append(instance)
+    def _types(tree):
+        types = found.get(tree['id'], set())
+        return [t for t in SCANNED_TYPES if t not in searched or t in types]
 
+    return [(tree, _types(tree)) for tree in to_scan]
 
-def _get_network_resources(tree, conf: OCIConfig):
+
+def _scan_compartments(ctx: RegionContext, jobs):
     """
-    retrieve: vcn, subnet, gateways, secury list, route tables
+    scan the resource types of the compartments, see _scan_resource_type
 
-    :param tree: compartment subtree
+    :param ctx: RegionContext object
+    :param jobs: list of (compartment, list of SCANNED_TYPES)
+    """
+    if ctx.scan_workers <= 1:
+        for tree, types in jobs:
+            for resource_type in types:
+                _scan_resource_type(tree, ctx, resource_type)
+        return
+
+    # every (compartment, resource type) pair is an independent job
+    with ThreadPoolExecutor(max_workers=ctx.scan_workers) as executor:
+        submitted = []
+        for tree, types in jobs:
+            futures = []
+            for resource_type in types:
+                bucket = _ScanBucket(tree)
+                futures.append((bucket, executor.submit(_scan_resource_type, bucket, ctx, resource_type)))
+            submitted.append((tree, futures))
+
+        # merge following the sequential order to build the same tree
+        for tree, futures in submitted:
+            for bucket, future in futures:
+                future.result()
+                bucket.merge_into(tree)
+
+
+def _region_scanned(scan: Scan, region, on_region=None):
+    """
+    index the scanned region and hand its compartment trees to on_region
     """
+    scan.registry.index_region(region, scan.trees[region])
+    _log_inventory(scan, region)
+    if on_region:
+        on_region(region, scan.trees[region])
 
-    ilist = oci.pagination.list_call_get_all_results(network_client.list_vcns, compartment_id=tree['id'])
 
-    def _get_nested_resources(api_list_call, res: OciResource, **kwargs):
-        try:
-            if 'vcn_id' in kwargs:
-                rlist = oci.pagination.list_call_get_all_results(api_list_call,
-                                                                 compartment_id=tree['id'],
-                                                                 vcn_id=kwargs.get('vcn_id'))
-            else:
-                rlist = oci.pagination.list_call_get_all_results(api_list_call,
-                                                                 compartment_id=tree['id'])
-            if not rlist.data:
-                return None
-            for r in rlist.data or []:
-                res_obj = res(r, network_client)
-                if conf.skip_scan_preserved_resources and res_obj.check_tags(conf.preserve_tags):
-                    continue
-                if not res_obj or not res_obj.is_active():
-                    continue
-                return res_obj
-        except oci.exceptions.ServiceError as se:
-            logging.error('unable to retrieve {}  VCN {}'.format(res.resource_type, vcn.id))
-            return None
+def _sharded_resource_list(scan: Scan, changed=None, on_region=None):
+    """
+    resource_list sharded across scan_processes processes, so that the deserialization of the api
+    responses and the construction of the resources scale across the cores.
+    The shards are the regions or the top level compartments (scan_shard). Every process returns the
+    records of the discovered resources, merged in the compartment trees following the sequential order
+    """
+    conf = scan.conf
+    regions = list(scan.trees.keys())
+    jobs = {r: _scan_jobs(scan.context(r), changed) for r in regions}
+
+    # the processes are not forked from the current one: the region probes and the api clients
+    # may have threads running, holding locks that would never be released in the child
+    mp_context = multiprocessing.get_context(SCAN_PROCESS_START_METHOD)
+    # the log records of the processes are emitted by the handlers of the current one
+    log_queue = mp_context.Queue()
+    log_listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers,
+                                                  respect_handler_level=True)
+    log_listener.start()
+    try:
+        with ProcessPoolExecutor(max_workers=conf.scan_processes, mp_context=mp_context,
+                                 initializer=_init_scan_process,
+                                 initargs=(log_queue, logging.getLogger().level)) as executor:
+            futures = {r: [(shard, executor.submit(_scan_shard, conf, r, [(tree.id, tree.name, types)
+                                                                          for tree, types in shard]))
+                           for shard in _shards(scan, r, jobs[r])]
+                       for r in regions}
+
+            for r in regions:
+                clients = _region_clients(scan.context(r))
+                for shard, future in futures[r]:
+                    _merge_shard(scan, r, shard, future.result(), clients)
+                _region_scanned(scan, r, on_region)
+    finally:
+        log_listener.stop()
+    return scan.trees
+
+
+def _shards(scan: Scan, region, jobs):
+    """
+    split the scan jobs of the region according with scan_shard
+
+    :return: list of shards, every shard is a list of scan jobs
+    """
+    if scan.conf.scan_shard != 'compartment':
+        return [jobs] if jobs else []
+
+    toplevel = {}
 
-    for i in ilist.data:
-        vcn = OciVcn(i, network_client)
-        vcn.append(_get_nested_resources(network_client.list_subnets, OciSubnet, vcn_id=vcn.id))
-        vcn.append(_get_nested_resources(network_client.list_internet_gateways, OciInternetGw, vcn_id=vcn.id))
-        vcn.append(_get_nested_resources(network_client.list_nat_gateways, OciNatGw, vcn_id=vcn.id))
-        vcn.append(_get_nested_resources(network_client.list_security_lists, OciSecurityList, vcn_id=vcn.id))
-        vcn.append(_get_nested_resources(network_client.list_route_tables, OciRouteTable, vcn_id=vcn.id))
-        vcn.append(_get_nested_resources(network_client.list_local_peering_gateways, OciLocalPeeringGw, vcn_id=vcn.id))
-        vcn.append(_get_nested_resources(network_client.list_service_gateways, OciServiceGw, vcn_id=vcn.id))
+    def _visit(tree, toplevel_id):
+        toplevel[tree.id] = toplevel_id
+        for nested in tree.get(R.COMPARTMENT) or []:
+            _visit(nested, toplevel_id)
 
-        tree.append(vcn)
+    for tree in scan.trees[region]:
+        _visit(tree, tree.id)
 
-    tree.append(_get_nested_resources(network_client.list_drgs, OciDRG))
-    tree.append(_get_nested_resources(network_client.list_cpes, OciCPE))
-    tree.append(_get_nested_resources(network_client.list_drg_attachments, OciDRGAttachment))
-    tree.append(_get_nested_resources(network_client.list_remote_peering_connections, OciRPC))
-    tree.append(_get_nested_resources(network_client.list_ip_sec_connections, OciVPN))
+    shards = {}
+    for tree, types in jobs:
+        shards.setdefault(toplevel[tree.id], []).append((tree, types))
+    return list(shards.values())
 
 
-def _get_bv_resources(tree, conf: OCIConfig):
+# start method of the scan processes, fork is not safe with running threads
+SCAN_PROCESS_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+def _init_scan_process(log_queue, log_level):
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(log_level)
+
+
+def _scan_shard(conf: OCIConfig, region, compartments):
+    """
+    scan a shard of compartments in a scan process
+
+    :param conf: OCIConfig object, the copy of the task
+    :param region: region name
+    :param compartments: list of (compartment OCID, compartment name, list of SCANNED_TYPES)
+    :return: (list of (parent OCID, resource record) in discovery order,
+    list of (parent OCID, nested OCID) of the dependencies injected via set_dependency,
+    list of (scan scope, resource record) of the preserved resources skipped by the discovery)
+    """
+    # the processes share the api rate limit
+    if conf.api_rate_limit:
+        conf._config_api_rate_limit = conf.api_rate_limit / conf.scan_processes
+    # the scan of the shard holds only the dependencies and the preserved resources of the shard
+    scan = Scan(conf)
+    ctx = scan.context(region)
+    jobs = [(_ScanBucket({'id': id, 'name': name}), types) for id, name, types in compartments]
+    _scan_compartments(ctx, jobs)
+
+    records, dependencies = [], []
+
+    def _records(parent_id, items):
+        for res in items:
+            records.append((parent_id, res.to_record()))
+            dependencies.extend((dependent, res.id) for dependent in sorted(scan.registry.get_dependents(res.id)))
+            for nested in res.values():
+                if isinstance(nested, list):
+                    _records(res.id, nested)
+
+    for bucket, _ in jobs:
+        for k, items in bucket.items():
+            if k not in ['id', 'name']:
+                _records(bucket['id'], items)
+
+    preserved = [(scope, res.to_record()) for scope, res in scan.registry.preserved(region)]
+    return records, dependencies, preserved
+
+
+def _merge_shard(scan: Scan, region, shard, result, clients):
     """
-    retrieve block volumes
+    merge the resources returned by _scan_shard into the compartment trees
 
-    :param tree: compartment subtree
+    :param scan: Scan the resources are merged into
+    :param region: region name
+    :param shard: scan jobs of the shard
+    :param result: result of _scan_shard
+    :param clients: dict client class name -> OCI API client of the region
+    """
+    records, dependencies, preserved = result
+    objects = {tree.id: tree for tree, _ in shard}
+    for parent_id, record in records:
+        res = OciResource.from_record(record, clients)
+        objects[parent_id].append(res)
+        objects[res.id] = res
+    for parent_id, nested_id in dependencies:
+        scan.registry.set_dependency(region, parent_id, objects[nested_id])
+    for scope, record in preserved:
+        scan.registry.add_preserved(region, scope, OciResource.from_record(record, clients))
+
+
+def _region_clients(ctx: RegionContext):
     """
+    :return: dict client class name -> OCI API client of the region
+    """
+    return {type(c).__name__: c for c in (ctx.identity_client, ctx.compute_client, ctx.network_client,
+                                          ctx.bv_client, ctx.lb_client, ctx.db_client)}
 
-    try:
-        ilist = oci.pagination.list_call_get_all_results(bv_client.list_volumes, compartment_id=tree['id'])
 
-        for i in ilist.data:
-            res_obj = OciBlockVolume(i, bv_client)
-            if (conf.skip_scan_preserved_resources and res_obj.check_tags(
-                    conf.preserve_tags)) or not res_obj.is_active():
-                continue
-            tree.append(res_obj)
-    except Exception as e:
-        logging.error('error while retrieving Block Volume resources')
+def _log_inventory(scan: Scan, region):
+    """
+    log the number of resources per type of the region
+    """
+    counts = scan.registry.count(region)
+    logging.info('{} inventory: {}'.format(region, ', '.join('{} {}'.format(counts[t], t) for t in sorted(counts))))
 
 
-def _get_lb_resources(tree, conf: OCIConfig):
+def _compartments_to_scan(conf: OCIConfig, trees, verbose=True):
     """
-    retrieve: lb resources
+    select the compartments whose resources must be scanned according with the compartment filter
 
-    :param tree: compartment subtree
+    :param conf: OCIConfig object
+    :param trees: compartment trees of a region
+    :param verbose: log the visited compartments
+    :return: list of compartments, nested compartments first
+    """
+
+    def _retrieve_compartments(tree, traverse_level=1, scan_resources=False, to_scan=None):
+        if verbose:
+            logging.info('{} {}'.format('__'*traverse_level, tree['name']))
+        items = tree.get(R.COMPARTMENT)
+        for nested_item in [] if not items else items:
+            traverse_level += 1
+            scan = scan_resources or conf.preserve_policy.in_filter(nested_item.name, nested_item.id)
+            _retrieve_compartments(nested_item, traverse_level, scan_resources=scan, to_scan=to_scan)
+            traverse_level -= 1
+        if scan_resources:
+            to_scan.append(tree)
+        return to_scan
+
+    to_scan = []
+    for tree in trees:
+        scan = conf.preserve_policy.in_filter(tree.name, tree.id)
+        _retrieve_compartments(tree, scan_resources=scan, to_scan=to_scan)
+    return to_scan
+
+
+def _search_resource_types(ctx: RegionContext):
     """
+    find the compartments containing resources of every type with a single structured search
 
-    ilist = oci.pagination.list_call_get_all_results(lb_client.list_load_balancers, compartment_id=tree['id'])
+    :param ctx: RegionContext object
+    :return: dict compartment OCID -> set of the SCANNED_TYPES to scan. None if the search failed
+    """
+    # the compartments with only terminated resources of a type are not scanned
+    query = 'query {} resources where {}'.format(', '.join(sorted(SEARCH_RESOURCE_TYPES.keys())),
+                                                 listing.active_search_condition())
+    try:
+        elems = ctx.list_all(ctx.search_client.search_resources,
+                             oci.resource_search.models.StructuredSearchDetails(type='Structured',
+                                                                                query=query,
+                                                                                matching_context_type='NONE'))
+    except oci.exceptions.ServiceError as se:
+        logging.warning('Resource Search failed, scanning all the resource types: {}'.format(se.message))
+        return None
+
+    found = {}
+    for item in elems.data:
+        resource_type = SEARCH_RESOURCE_TYPES.get(item.resource_type.lower())
+        if resource_type:
+            found.setdefault(item.compartment_id, set()).add(resource_type)
+    return found
+
+
+def _scan_resource_type(tree, ctx: RegionContext, resource_type):
+    """
+    retrieve the resources of a type nested in the compartment, together with the resources nested in them.
+    The scan of every type is described by its ResourceDescriptor
 
-    for i in ilist.data:
-        res_obj = OciLoadBalancer(i, lb_client)
-        if (conf.skip_scan_preserved_resources and res_obj.check_tags(conf.preserve_tags)) or not res_obj.is_active():
-            continue
+    :param tree: compartment subtree
+    :param ctx: RegionContext object
+    :param resource_type: one of SCANNED_TYPES
+    """
+    for res_obj in _list_resources(tree, ctx, resource_type):
         tree.append(res_obj)
 
 
-def _get_db_resources(tree, conf: OCIConfig):
+def _list_resources(tree, ctx: RegionContext, resource_type):
     """
-    retrieve: db_system resources
+    list the active resources of a type in the compartment.
+    Every nested type is listed with a single call per compartment and its resources are joined to their parents.
+    The nested types are listed only if there are parents to join them to
 
     :param tree: compartment subtree
+    :param ctx: RegionContext object
+    :param resource_type: resource type, see DESCRIPTORS
+    :return: list of resources
     """
+    descriptor = DESCRIPTORS[resource_type]
+    api_client = getattr(ctx, descriptor.client)
+    try:
+        elems = ctx.list_all(getattr(api_client, descriptor.list_operation), compartment_id=tree['id'])
+    except oci.exceptions.ServiceError as se:
+        logging.error('unable to retrieve {} in compartment {}: {}'.format(resource_type, tree['name'], se.message))
+        return []
+
+    resource_class = RESOURCE_CLASSES[resource_type]
+    resources = []
+    for elem in elems.data:
+        res_obj = resource_class(elem, api_client)
+        if descriptor.skip_preserved and _skip_preserved(ctx, tree, res_obj) or not res_obj.is_active():
+            continue
+        resources.append(res_obj)
+    if not resources:
+        return resources
+
+    parents = {res_obj.id: res_obj for res_obj in resources}
+    for nested_type in NESTED_TYPES.get(resource_type, []):
+        parent_attribute = DESCRIPTORS[nested_type].parent_attribute
+        for nested in _list_resources(tree, ctx, nested_type):
+            parent = parents.get(nested.reference(parent_attribute))
+            if parent is not None:
+                parent.append(nested)
+
+    inject_dependencies = _DEPENDENCY_INJECTORS.get(resource_type)
+    if inject_dependencies:
+        for res_obj in resources:
+            inject_dependencies(ctx, tree, res_obj)
+    return resources
+
+
+def _skip_preserved(ctx: RegionContext, tree, res_obj: OciResource):
+    """
+    check if a discovered resource is preserved and must not be scanned (skip_scan_preserved_resources).
+    The skipped resources are registered: the cleanup keeps the resources they depend on
 
-    ilist = oci.pagination.list_call_get_all_results(db_client.list_db_systems, compartment_id=tree['id'])
+    :param ctx: RegionContext of the scan
+    :param tree: compartment subtree the resource is found in
+    :return: True if the resource must be skipped
+    """
+    if not (ctx.skip_scan_preserved_resources and res_obj.check_tags(ctx.preserve_policy)):
+        return False
+    if res_obj.is_active():
+        ctx.registry.add_preserved(ctx.workon_region, tree['id'], res_obj)
+    return True
 
-    for i in ilist.data:
-        res_obj = OciDbSystem(i, db_client)
-        if (conf.skip_scan_preserved_resources and res_obj.check_tags(conf.preserve_tags)) or not res_obj.is_active():
-            continue
-        dbhomes = db_client.list_db_homes(tree['id'], res_obj.id)
-        if dbhomes and dbhomes.data:
-            for dbh in dbhomes.data:
-                res_obj.append(OciDBHome(dbh, db_client))
-        tree.append(res_obj)
 
-    ilist = oci.pagination.list_call_get_all_results(db_client.list_backups, compartment_id=tree['id'])
+def _instance_dependencies(ctx: RegionContext, tree, instance: OciResource):
+    """
+    vcn dependency tree for clean-up operation:
+    if primary vnic the dependency is on the instance as I can't detach the primary vnic
+    else is just the vnic-attachment
+    """
+    attachments = instance.get(R.VNIC_ATTACHMENT) or []
+    # an instance has exactly one primary vnic: stop looking as soon as it is found
+    primary = attachments[0] if len(attachments) == 1 else \
+        next((a for a in attachments if _is_primary_vnic(ctx, a.reference('vnic_id'))), None)
+    for res_obj in attachments:
+        if res_obj is primary:
+            ctx.registry.set_dependency(ctx.workon_region, res_obj.reference('subnet_id'), instance)
+        else:
+            ctx.registry.set_dependency(ctx.workon_region, res_obj.reference('subnet_id'), res_obj)
+
+
+def _is_primary_vnic(ctx: RegionContext, vnic_id):
+    """
+    check if the vnic is the primary vnic of its instance.
+    The vnic attachments don't report it and no list api returns the vnics: the vnic is read
 
-    for i in ilist.data:
-        res_obj = OciDbBackup(i, db_client)
-        if (conf.skip_scan_preserved_resources and res_obj.check_tags(conf.preserve_tags)) or not res_obj.is_active():
-            continue
-        tree.append(res_obj)
+    :param ctx: RegionContext of the vnic region
+    :param vnic_id: vnic OCID
+    """
+    try:
+        return ctx.network_client.get_vnic(vnic_id).data.is_primary
+    except oci.exceptions.ServiceError as se:
+        logging.error('unable to retrieve vnic {}: {}'.format(vnic_id, se.message))
+        return False
 
 
-def _get_autonomous_resources(tree, conf: OCIConfig):
+def _db_system_dependencies(ctx: RegionContext, tree, db_system: OciResource):
     """
-    retrieve: autonomous db resources
+    Due to a limitation with the Data Guard implementation on VM shapes
+    primary db-system must be deleted before deleting db_home and standby db-system.
+    Inject the standby db-system dependency on its primary
+    """
+    if db_system.to_json(nested=False).get('database_edition') not in DATA_GUARD_EDITIONS:
+        return
+    for dbhome in db_system.get(R.DB_HOME) or []:
+        try:
+            databases = ctx.list_all(ctx.db_client.list_databases, tree['id'], db_home_id=dbhome.id)
+            for db in databases.data:
+                associations = ctx.list_all(ctx.db_client.list_data_guard_associations, db.id)
+                for dga in associations.data:
+                    if dga.role == 'PRIMARY' and dga.peer_db_system_id:
+                        ctx.registry.set_dependency(ctx.workon_region, dga.peer_db_system_id, db_system)
+        except oci.exceptions.ServiceError as se:
+            logging.error('unable to retrieve data guard associations of db home {}: {}'.format(dbhome.id, se.message))
 
-    :param tree: compartment subtree
+
+def _scanned_type(resource_type):
     """
+    :return: the type nested in the compartments the resources of the type are discovered with
+    """
+    while DESCRIPTORS[resource_type].parent_type != R.COMPARTMENT:
+        resource_type = DESCRIPTORS[resource_type].parent_type
+    return resource_type
 
-    ilist = oci.pagination.list_call_get_all_results(db_client.list_autonomous_databases, compartment_id=tree['id'])
-    for i in ilist.data:
-        res_obj = OciAutonomousDB(i, db_client)
-        if (conf.skip_scan_preserved_resources and res_obj.check_tags(conf.preserve_tags)) or not res_obj.is_active():
-            continue
-        tree.append(res_obj)
+
+# resource types scanned in every compartment, in discovery order.
+# Every type is scanned together with the types nested in it (e.g. vcn with subnets and gateways)
+SCANNED_TYPES = NESTED_TYPES[R.COMPARTMENT]
+
+# Resource Search type (lower case) -> scanned type of its resources.
+# The scanned types without Resource Search types (e.g. db backups) are always scanned
+SEARCH_RESOURCE_TYPES = {d.search_type.lower(): _scanned_type(t) for t, d in DESCRIPTORS.items() if d.search_type}
+
+# resource type -> function injecting the dependencies not inferable via compartment scanning
+_DEPENDENCY_INJECTORS = {
+    R.INSTANCE: _instance_dependencies,
+    R.DB_SYSTEM: _db_system_dependencies,
+}
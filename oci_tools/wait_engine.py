@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from . import LIFECYCLE_KO_STATUS
+
+
+def completed(result):
+    """
+    :return: a Future already resolved with result
+    """
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class _PendingTermination:
+
+    def __init__(self, res, future, interval, max_wait):
+        self.resource = res
+        self.future = future
+        self.interval = interval
+        self.next_check = time.time() + interval
+        self.deadline = time.time() + max_wait
+
+
+class WaitEngine:
+    """
+    track all the pending terminations and poll their lifecycle state from a single thread.
+    The polling interval of every resource grows from min_interval up to max_interval.
+    Resources in the same poll group (region, compartment, type) are refreshed together
+    with a single list call. The polling thread runs only while terminations are pending
+    """
+
+    def __init__(self, min_interval=2, max_interval=30, backoff=1.5, max_wait=1200):
+        """
+        :param min_interval: seconds before the first state check
+        :param max_interval: maximum seconds between two state checks
+        :param backoff: interval growth factor
+        :param max_wait: seconds after which the termination is considered failed
+        """
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self._max_wait = max_wait
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending)
+
+    def is_alive(self):
+        """
+        :return: False if the polling thread has been started and it is no longer running
+        """
+        with self._condition:
+            return self._thread is None or self._thread.is_alive()
+
+    def track(self, res):
+        """
+        wait for the resource to reach a LIFECYCLE_KO_STATUS
+
+        :param res: OciResource whose termination has been submitted
+        :return: Future resolved with True when the resource is terminated
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._condition:
+            self._pending.append(_PendingTermination(res, future, self._min_interval, self._max_wait))
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='wait-engine', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._pending:
+                    # idle, track starts a new thread
+                    self._thread = None
+                    return
+                now = time.time()
+                due = [p for p in self._pending if p.next_check <= now]
+                if not due:
+                    self._condition.wait(min(p.next_check for p in self._pending) - now)
+                    continue
+            try:
+                resolved = self._poll(due)
+            except Exception as e:
+                # an unexpected error must not stop the engine: the due terminations are failed
+                logging.error('unable to check the pending terminations: {}'.format(e))
+                resolved = [(pending, False) for pending in due]
+            for pending, terminated in resolved:
+                self._resolve(pending, terminated)
+
+    def _poll(self, due):
+        """
+        check the lifecycle state of the due resources.
+        When a resource is due, all the resources in its poll group are refreshed
+
+        :return: list of (pending termination, result) for the resolved terminations
+        """
+        with self._condition:
+            groups = {}
+            for pending in self._pending:
+                groups.setdefault(pending.resource.poll_group(), []).append(pending)
+
+        to_check = []
+        for pending in due:
+            group = pending.resource.poll_group()
+            members = [pending] if group is None else groups.pop(group, None)
+            if members is None:
+                # already refreshed with its poll group
+                continue
+            if len(members) < 2:
+                to_check.append((pending, False))
+            else:
+                to_check.extend(self._refresh_group(members))
+
+        resolved = []
+        for pending, state in to_check:
+            res = pending.resource
+            if state is False:
+                try:
+                    state = res.refresh_state()
+                except Exception as e:
+                    logging.error(str(e))
+                    resolved.append((pending, False))
+                    continue
+            if state is None or state in LIFECYCLE_KO_STATUS:
+                resolved.append((pending, True))
+            elif time.time() > pending.deadline:
+                logging.error('timeout waiting for {} {} termination'.format(res.resource_type, res.name))
+                resolved.append((pending, False))
+            else:
+                self._reschedule(pending)
+        return resolved
+
+    def _refresh_group(self, group):
+        """
+        refresh the state of a poll group with a single list call
+
+        :return: list of (pending termination, state). state is False if it must be read one by one
+        """
+        resources = [pending.resource for pending in group]
+        try:
+            states = resources[0].refresh_group_states(resources)
+        except Exception as e:
+            logging.debug('unable to list {}: {}'.format(resources[0].resource_type, e))
+            return [(pending, False) for pending in group]
+        return list(zip(group, states))
+
+    def _reschedule(self, pending):
+        pending.interval = min(pending.interval * self._backoff, self._max_interval)
+        pending.next_check = time.time() + pending.interval
+
+    def _resolve(self, pending, terminated):
+        with self._condition:
+            if pending not in self._pending:
+                return
+            self._pending.remove(pending)
+        if not pending.future.done():
+            pending.future.set_result(terminated)
+
+
+# wait engine of the terminations not bound to a scan, every Scan has its own
+wait_engine = WaitEngine()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Compare the resource serialization used by OciResource.to_json with the previous
+json.loads(str(model)) round trip on synthetic resources.
+
+usage: python scripts/benchmark_to_json.py [number of resources]
+"""
+import datetime
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from oci.core.models import Instance, InstanceSourceViaImageDetails, Subnet, Vcn  # noqa: E402
+from oci_tools.oci_resources import OciInstance, OciSubnet, OciVcn  # noqa: E402
+from oci_tools.serialization import model_to_dict  # noqa: E402
+
+NOW = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+TAGS = {'training': {'foundation': 'true', 'owner': 'oci-tools'}}
+
+
+def _resources(count):
+    compartment_id = 'ocid1.compartment.oc1..benchmark'
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            yield OciVcn(Vcn(id='ocid1.vcn.oc1..{:08d}'.format(i), compartment_id=compartment_id,
+                             display_name='vcn-{}'.format(i), cidr_block='10.0.0.0/16', dns_label='vcn',
+                             lifecycle_state='AVAILABLE', time_created=NOW,
+                             freeform_tags={'env': 'test'}, defined_tags=TAGS))
+        elif kind == 1:
+            yield OciSubnet(Subnet(id='ocid1.subnet.oc1..{:08d}'.format(i), compartment_id=compartment_id,
+                                   vcn_id='ocid1.vcn.oc1..{:08d}'.format(i - 1), display_name='subnet-{}'.format(i),
+                                   cidr_block='10.0.1.0/24', security_list_ids=['ocid1.securitylist.oc1..a'],
+                                   lifecycle_state='AVAILABLE', time_created=NOW,
+                                   freeform_tags={'env': 'test'}, defined_tags=TAGS))
+        else:
+            yield OciInstance(Instance(id='ocid1.instance.oc1..{:08d}'.format(i), compartment_id=compartment_id,
+                                       display_name='instance-{}'.format(i), availability_domain='AD-1',
+                                       shape='VM.Standard2.1', region='us-ashburn-1',
+                                       metadata={'ssh_authorized_keys': 'ssh-rsa AAAA'},
+                                       source_details=InstanceSourceViaImageDetails(
+                                           source_type='image', image_id='ocid1.image.oc1..a'),
+                                       lifecycle_state='RUNNING', time_created=NOW,
+                                       freeform_tags={'env': 'test'}, defined_tags=TAGS))
+
+
+def _measure(label, models, serialize):
+    start = time.perf_counter()
+    result = [serialize(model) for model in models]
+    elapsed = time.perf_counter() - start
+    print('{:<28} {:8.2f}s {:10.0f} resources/s'.format(label, elapsed, len(models) / elapsed))
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    resources = list(_resources(count))
+    models = [res.resource for res in resources]
+    print('{} synthetic resources'.format(count))
+
+    previous = _measure('json.loads(str(model))', models, lambda model: json.loads(str(model)))
+    current = _measure('model_to_dict(model)', models, model_to_dict)
+    if previous != current:
+        sys.exit('serialization results differ')
+
+
+if __name__ == '__main__':
+    main()
@@ -19,7 +19,7 @@ setup(
         'entrypoints>=0.3'
         'idna>=2.8'
         'mccabe>=0.6.1'
-        'oci>=2.2.5'
+        'oci>=2.20.0'
         'pycodestyle>=2.5.0'
         'pycparser>=2.19'
         'pyflakes>=2.1.1'
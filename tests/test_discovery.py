@@ -0,0 +1,144 @@
+import os
+import tempfile
+import unittest
+
+from oci.core.models import Instance, Volume
+from oci.identity.models import Compartment, RegionSubscription
+from oci.response import Response
+
+from oci_tools import RESOURCE as R
+from oci_tools import oci_config, training_tools
+
+TENANCY = 'ocid1.tenancy.oc1..t'
+COMPARTMENT = 'ocid1.compartment.oc1..c'
+NESTED_COMPARTMENT = 'ocid1.compartment.oc1..n'
+REGION = 'us-ashburn-1'
+
+CONFIG = """[DEFAULT]
+user=ocid1.user.oc1..u
+fingerprint=aa:bb:cc:dd:ee:ff:00:11:22:33:44:55:66:77:88:99
+key_file={key_file}
+tenancy={tenancy}
+region={region}
+
+[OCI_TOOLS]
+preserve_tags=keep=true
+preserve_top_level_compartment=true
+"""
+
+# arguments of the list operations that don't filter the items
+LIST_ARGUMENTS = ('limit', 'page', 'detail', 'compartment_id_in_subtree')
+
+
+class _FakeClient:
+    """
+    list operations of every service returning the items of the fake tenancy
+    """
+
+    def __init__(self, items):
+        """
+        :param items: list operation -> list of SDK models
+        """
+        self.items = items
+
+    def __getattr__(self, name):
+        if not name.startswith('list_'):
+            raise AttributeError(name)
+
+        def _list(compartment_id=None, **kwargs):
+            data = [m for m in self.items.get(name, [])
+                    if kwargs.get('compartment_id_in_subtree') or m.compartment_id == compartment_id]
+            for key, value in kwargs.items():
+                if key not in LIST_ARGUMENTS:
+                    data = [m for m in data if getattr(m, key, None) == value]
+            return Response(200, {}, data, None)
+
+        _list.__name__ = name
+        return _list
+
+
+class _FakePool:
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, service, region=None):
+        return self.client
+
+
+def _instance(id, tags):
+    return Instance(id=id, compartment_id=COMPARTMENT, display_name=id.rpartition('.')[2],
+                    lifecycle_state='RUNNING', freeform_tags=tags, defined_tags={})
+
+
+class RepeatedDiscoveryTest(unittest.TestCase):
+    """
+    two discoveries in the same process with the same configuration: the preserve tags changed
+    between the two are honoured by the second one
+    """
+
+    def setUp(self):
+        handle, self.config_path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as f:
+            f.write(CONFIG.format(key_file=self.config_path, tenancy=TENANCY, region=REGION))
+        self.conf = oci_config.OCIConfig(self.config_path, operation='dryrun')
+        self.conf.region_subscriptions = [RegionSubscription(region_name=REGION, is_home_region=True)]
+        self.first = _instance('ocid1.instance.oc1..first', {'keep': 'true'})
+        self.second = _instance('ocid1.instance.oc1..second', {})
+        compartment = Compartment(id=COMPARTMENT, compartment_id=TENANCY, name='c', lifecycle_state='ACTIVE',
+                                  freeform_tags={}, defined_tags={})
+        self.conf._client_pool = _FakePool(_FakeClient({'list_compartments': [compartment],
+                                                        'list_instances': [self.first, self.second]}))
+
+    def tearDown(self):
+        os.remove(self.config_path)
+
+    def _terminated(self):
+        scan = training_tools.discover(self.conf)
+        done, failed = training_tools.cleanup(scan)[REGION]
+        return {res.id for res in done if res.resource_type == R.INSTANCE}, scan
+
+    def test_changed_tags(self):
+        terminated, first_scan = self._terminated()
+        self.assertEqual(terminated, {self.second.id})
+
+        self.first.freeform_tags, self.second.freeform_tags = {}, {'keep': 'true'}
+        terminated, second_scan = self._terminated()
+        self.assertEqual(terminated, {self.first.id})
+
+        self.assertIsNot(first_scan.registry, second_scan.registry)
+        self.assertIsNot(first_scan.preserve_policy, second_scan.preserve_policy)
+        self.assertIsNot(first_scan.wait_engine, second_scan.wait_engine)
+
+
+class KeptResourceTest(unittest.TestCase):
+    """
+    the block volumes are discovered but not terminated: the compartment holding them is kept
+    """
+
+    def setUp(self):
+        handle, self.config_path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as f:
+            f.write(CONFIG.format(key_file=self.config_path, tenancy=TENANCY, region=REGION))
+        self.conf = oci_config.OCIConfig(self.config_path, operation='dryrun')
+        self.conf.region_subscriptions = [RegionSubscription(region_name=REGION, is_home_region=True)]
+        compartments = [Compartment(id=id, compartment_id=parent, name=id.rpartition('.')[2],
+                                    lifecycle_state='ACTIVE', freeform_tags={}, defined_tags={})
+                        for id, parent in ((COMPARTMENT, TENANCY), (NESTED_COMPARTMENT, COMPARTMENT))]
+        volume = Volume(id='ocid1.volume.oc1..v', compartment_id=NESTED_COMPARTMENT, display_name='v',
+                        lifecycle_state='AVAILABLE', freeform_tags={}, defined_tags={})
+        self.conf._client_pool = _FakePool(_FakeClient({'list_compartments': compartments,
+                                                        'list_volumes': [volume]}))
+
+    def tearDown(self):
+        os.remove(self.config_path)
+
+    def test_compartment_kept(self):
+        scan = training_tools.discover(self.conf)
+        done, failed = training_tools.cleanup(scan)[REGION]
+        self.assertNotIn(NESTED_COMPARTMENT, {res.id for res in done})
+        self.assertIn(NESTED_COMPARTMENT, {res.id for res in failed})
+
+
+if __name__ == '__main__':
+    unittest.main()
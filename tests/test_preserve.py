@@ -0,0 +1,107 @@
+import unittest
+
+from oci.core.models import Vcn
+
+from oci_tools.oci_resources import OciVcn
+from oci_tools.preserve import NameMatcher, PreservePolicy
+
+COMPARTMENT = 'ocid1.compartment.oc1..c'
+
+
+def _vcn(name, freeform_tags=None, defined_tags=None):
+    return OciVcn(Vcn(id='ocid1.vcn.oc1..' + name, compartment_id=COMPARTMENT, display_name=name,
+                      lifecycle_state='AVAILABLE', freeform_tags=freeform_tags or {},
+                      defined_tags=defined_tags or {}))
+
+
+class NameMatcherTest(unittest.TestCase):
+    """
+    exact names, prefixes ending with * and regular expressions starting with re:
+    """
+
+    def test_patterns(self):
+        matcher = NameMatcher('ManagedCompartmentForPaaS, training-*, re:^team[0-9]+$')
+
+        self.assertTrue(matcher.match('ManagedCompartmentForPaaS'))
+        self.assertFalse(matcher.match('ManagedCompartment'))
+        self.assertTrue(matcher.match('training-01'))
+        self.assertFalse(matcher.match('my-training-01'))
+        self.assertTrue(matcher.match('team42'))
+        self.assertFalse(matcher.match('team42-dev'))
+        self.assertFalse(matcher.match(None))
+
+    def test_regex_search(self):
+        # the regular expressions are not anchored
+        matcher = NameMatcher(['re:dev'])
+
+        self.assertTrue(matcher.match('team-dev-01'))
+        self.assertFalse(matcher.match('team-prod-01'))
+
+    def test_empty(self):
+        for patterns in (None, '', [], ' , '):
+            matcher = NameMatcher(patterns)
+            self.assertFalse(matcher)
+            self.assertFalse(matcher.match('training-01'))
+
+    def test_invalid_regex(self):
+        # an invalid regular expression is ignored, the other patterns are still matched
+        matcher = NameMatcher('re:team[, sandbox')
+
+        self.assertTrue(matcher.match('sandbox'))
+        self.assertFalse(matcher.match('team['))
+
+
+class PreservePolicyTest(unittest.TestCase):
+    """
+    preserve_tags matched on the free-form and defined tags of the resources
+    """
+
+    def setUp(self):
+        self.policy = PreservePolicy('keep=true, lock, ops.owner=admin, ops.pinned')
+
+    def test_freeform_tags(self):
+        self.assertTrue(self.policy.is_tagged(_vcn('a', {'keep': 'true'})))
+        self.assertFalse(self.policy.is_tagged(_vcn('b', {'keep': 'false'})))
+        self.assertTrue(self.policy.is_tagged(_vcn('c', {'lock': 'any value'})))
+        self.assertFalse(self.policy.is_tagged(_vcn('d', {'owner': 'admin'})))
+
+    def test_defined_tags(self):
+        self.assertTrue(self.policy.is_tagged(_vcn('a', defined_tags={'ops': {'owner': 'admin'}})))
+        self.assertFalse(self.policy.is_tagged(_vcn('b', defined_tags={'ops': {'owner': 'user'}})))
+        self.assertTrue(self.policy.is_tagged(_vcn('c', defined_tags={'ops': {'pinned': False}})))
+        self.assertFalse(self.policy.is_tagged(_vcn('d', defined_tags={'dev': {'owner': 'admin'}})))
+
+    def test_tags(self):
+        self.assertEqual(self.policy.tags, {'free-tags': {'keep': 'true', 'lock': None},
+                                            'defined-tags': {'ops': {'owner': 'admin', 'pinned': None}}})
+
+    def test_changed_tags(self):
+        # the decisions are keyed by the tags of the resource
+        vcn = _vcn('a', {'keep': 'true'})
+        self.assertTrue(self.policy.is_tagged(vcn))
+        vcn._freeform_tags = {}
+        self.assertFalse(self.policy.is_tagged(vcn))
+
+    def test_scoped(self):
+        scoped = self.policy.scoped()
+        self.policy.is_tagged(_vcn('a', {'keep': 'true'}))
+
+        self.assertEqual(scoped._decisions, {})
+        self.assertEqual(scoped.tags, self.policy.tags)
+        self.assertTrue(scoped.is_tagged(_vcn('a', {'keep': 'true'})))
+
+    def test_compartments(self):
+        policy = PreservePolicy(preserve_compartments='ManagedCompartmentForPaaS, re:^shared-',
+                                compartment_filter='training-*, ocid1.compartment.oc1..c')
+
+        self.assertTrue(policy.is_preserved_name('shared-network'))
+        self.assertFalse(policy.is_preserved_name('training-01'))
+        self.assertTrue(policy.has_filter)
+        self.assertTrue(policy.in_filter('training-01'))
+        self.assertTrue(policy.in_filter('other', COMPARTMENT))
+        self.assertFalse(policy.in_filter('other', 'ocid1.compartment.oc1..other'))
+        self.assertTrue(PreservePolicy().in_filter('other'))
+
+
+if __name__ == '__main__':
+    unittest.main()
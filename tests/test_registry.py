@@ -0,0 +1,83 @@
+import unittest
+
+from oci.core.models import Instance, Subnet, Vcn
+from oci.identity.models import Compartment
+
+from oci_tools import RESOURCE as R
+from oci_tools.oci_resources import OciCompartment, OciInstance, OciSubnet, OciVcn
+from oci_tools.resource_registry import ResourceRegistry
+
+TENANCY = 'ocid1.tenancy.oc1..t'
+COMPARTMENT = 'ocid1.compartment.oc1..c'
+REGION = 'us-ashburn-1'
+OTHER_REGION = 'eu-frankfurt-1'
+
+
+def _model(model_class, id, **kwargs):
+    kwargs.setdefault('freeform_tags', {})
+    kwargs.setdefault('lifecycle_state', 'AVAILABLE')
+    return model_class(id=id, compartment_id=COMPARTMENT, display_name=id.rpartition('.')[2],
+                       defined_tags={}, **kwargs)
+
+
+def _tree(suffix=''):
+    compartment = OciCompartment(Compartment(id=COMPARTMENT, compartment_id=TENANCY, name='c',
+                                             lifecycle_state='ACTIVE', freeform_tags={}, defined_tags={}))
+    vcn = OciVcn(_model(Vcn, 'ocid1.vcn.oc1..vcn' + suffix, freeform_tags={'keep': 'true'}))
+    vcn.append(OciSubnet(_model(Subnet, 'ocid1.subnet.oc1..subnet' + suffix, vcn_id=vcn.id)))
+    compartment.append(vcn)
+    compartment.append(OciInstance(_model(Instance, 'ocid1.instance.oc1..instance' + suffix,
+                                          lifecycle_state='RUNNING')))
+    return compartment
+
+
+class RegistryQueryTest(unittest.TestCase):
+    """
+    resources indexed per region by OCID, type, compartment, lifecycle state and tag
+    """
+
+    def setUp(self):
+        self.registry = ResourceRegistry()
+        self.registry.index_region(REGION, [_tree()])
+        self.registry.index_region(OTHER_REGION, [_tree('-other')])
+
+    def _ids(self, *args, **criteria):
+        return [res.id.rpartition('.')[2] for res in self.registry.query(*args, **criteria)]
+
+    def test_query(self):
+        # the results follow the tree pre-order
+        self.assertEqual(self._ids(REGION), ['c', 'vcn', 'subnet', 'instance'])
+        self.assertEqual(self._ids(REGION, resource_type=R.SUBNET), ['subnet'])
+        self.assertEqual(self._ids(REGION, compartment=COMPARTMENT), ['vcn', 'subnet', 'instance'])
+        self.assertEqual(self._ids(resource_type=R.VCN), ['vcn', 'vcn-other'])
+        self.assertEqual(self._ids(REGION, resource_type=R.VCN, tag='keep=true'), ['vcn'])
+        self.assertEqual(self._ids(REGION, tag='keep'), ['vcn'])
+        self.assertEqual(self._ids(REGION, tag='keep=false'), [])
+        self.assertEqual(self._ids(REGION, id='ocid1.subnet.oc1..subnet-other'), [])
+        self.assertEqual(self.registry.count(REGION), {R.COMPARTMENT: 1, R.VCN: 1, R.SUBNET: 1, R.INSTANCE: 1})
+
+    def test_compartment_in_every_region(self):
+        compartments = self.registry.query(resource_type=R.COMPARTMENT)
+        self.assertEqual(len(compartments), 2)
+        self.assertIs(self.registry.get(COMPARTMENT, REGION), compartments[0])
+
+    def test_lifecycle_state(self):
+        instance, = self.registry.query(REGION, resource_type=R.INSTANCE)
+        instance._set_lifecycle_state('TERMINATED')
+
+        self.assertEqual(self._ids(REGION, lifecycle_state='RUNNING'), [])
+        self.assertEqual(self._ids(REGION, lifecycle_state='TERMINATED'), ['instance'])
+
+    def test_index_region(self):
+        # the resources of the region are replaced, the other regions are not changed
+        previous, = self.registry.query(REGION, resource_type=R.INSTANCE)
+        self.registry.index_region(REGION, [_tree('-new')])
+
+        self.assertEqual(self._ids(REGION), ['c', 'vcn-new', 'subnet-new', 'instance-new'])
+        self.assertEqual(self._ids(OTHER_REGION, resource_type=R.VCN), ['vcn-other'])
+        self.assertIsNone(previous._registry)
+        self.assertEqual(len(self.registry), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
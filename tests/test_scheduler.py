@@ -0,0 +1,167 @@
+import unittest
+
+from oci.core.models import InternetGateway, RouteRule, RouteTable, SecurityList, Subnet, Vcn
+from oci.exceptions import ServiceError
+from oci.identity.models import Compartment
+from oci.response import Response
+
+from oci_tools.oci_resources import OciCompartment, OciInternetGw, OciRouteTable, OciSecurityList, OciSubnet, OciVcn
+from oci_tools.preserve import PreservePolicy
+from oci_tools.scheduler import CleanupPlan
+from oci_tools.wait_engine import WaitEngine
+
+TENANCY = 'ocid1.tenancy.oc1..t'
+COMPARTMENT = 'ocid1.compartment.oc1..c'
+VCN = 'ocid1.vcn.oc1..vcn'
+
+
+def _model(model_class, id, **kwargs):
+    kwargs.setdefault('freeform_tags', {})
+    kwargs.setdefault('lifecycle_state', 'AVAILABLE')
+    return model_class(id=id, compartment_id=COMPARTMENT, display_name=id.rpartition('.')[2],
+                       defined_tags={}, **kwargs)
+
+
+class PreservedSubnetTest(unittest.TestCase):
+    """
+    the route table and the security lists of a preserved subnet, and the gateways targeted
+    by the route rules of the route table, are not terminated
+    """
+
+    def setUp(self):
+        self.vcn = OciVcn(_model(Vcn, VCN))
+        self.igw = OciInternetGw(_model(InternetGateway, 'ocid1.igw.oc1..igw', vcn_id=VCN))
+        self.route_table = OciRouteTable(_model(
+            RouteTable, 'ocid1.rt.oc1..rt', vcn_id=VCN,
+            route_rules=[RouteRule(destination='0.0.0.0/0', network_entity_id=self.igw.id)]))
+        self.security_list = OciSecurityList(_model(SecurityList, 'ocid1.sl.oc1..sl', vcn_id=VCN))
+        self.subnet = OciSubnet(_model(Subnet, 'ocid1.subnet.oc1..subnet', vcn_id=VCN,
+                                       route_table_id=self.route_table.id,
+                                       security_list_ids=[self.security_list.id],
+                                       dhcp_options_id='ocid1.dhcpoptions.oc1..dhcp',
+                                       freeform_tags={'keep': 'true'}))
+        # not referenced by the preserved subnet
+        self.unused_route_table = OciRouteTable(_model(RouteTable, 'ocid1.rt.oc1..unused', vcn_id=VCN,
+                                                       route_rules=[]))
+        self.unused_security_list = OciSecurityList(_model(SecurityList, 'ocid1.sl.oc1..unused', vcn_id=VCN))
+
+        self.plan = CleanupPlan()
+        for res in (self.subnet, self.route_table, self.security_list, self.igw,
+                    self.unused_route_table, self.unused_security_list):
+            self.plan.add(res, scope=COMPARTMENT)
+            self.plan.add_dependency(res.id, self.vcn.id)
+        self.plan.add(self.vcn, scope=COMPARTMENT)
+
+    def test_references(self):
+        self.assertEqual(self.subnet.reference('route_table_id'), self.route_table.id)
+        self.assertEqual(self.subnet.reference('security_list_ids'), (self.security_list.id,))
+        self.assertEqual(self.route_table.reference('route_rules.network_entity_id'), (self.igw.id,))
+
+    def test_preserved_subnet(self):
+        done, failed = self.plan.run(simulate=True, preserve_policy=PreservePolicy('keep=true'))
+
+        self.assertEqual({res.id for res in done}, {self.unused_route_table.id, self.unused_security_list.id})
+        self.assertEqual({res.id for res in failed},
+                         {self.subnet.id, self.route_table.id, self.security_list.id, self.igw.id, self.vcn.id})
+
+
+class _FakeNetworkClient:
+    """
+    vcn operations: the deletion of the failing vcns is rejected, the others are terminated at once
+    """
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.deleted = []
+
+    def delete_vcn(self, id):
+        if id in self.failing:
+            raise ServiceError(409, 'Conflict', {}, 'vcn {} has dependent resources'.format(id))
+        self.deleted.append(id)
+
+    def get_vcn(self, id):
+        return Response(200, {}, _model(Vcn, id, lifecycle_state='TERMINATED'), None)
+
+    def list_vcns(self, compartment_id=None, **kwargs):
+        return Response(200, {}, [_model(Vcn, id, lifecycle_state='TERMINATED') for id in self.deleted], None)
+
+
+class PlanRunTest(unittest.TestCase):
+    """
+    terminations following the dependency graph: failures are propagated to the dependent resources
+    unless the dependency is optional, cycles are reported as not terminated
+    """
+
+    def setUp(self):
+        self.engine = WaitEngine(min_interval=0.01, max_interval=0.05)
+        self.plan = CleanupPlan(self.engine)
+
+    def _vcns(self, client, *names):
+        vcns = [OciVcn(_model(Vcn, 'ocid1.vcn.oc1..' + name), client) for name in names]
+        for vcn in vcns:
+            self.plan.add(vcn, scope=COMPARTMENT)
+        return vcns
+
+    def _run(self):
+        done, failed = self.plan.run(workers=4)
+        return [res.name for res in done], {res.name for res in failed}
+
+    def test_order(self):
+        client = _FakeNetworkClient()
+        a, b, c = self._vcns(client, 'a', 'b', 'c')
+        self.plan.add_dependency(b.id, c.id)
+        self.plan.add_dependency(a.id, b.id)
+
+        done, failed = self._run()
+        self.assertEqual(done, ['a', 'b', 'c'])
+        self.assertEqual(failed, set())
+        self.assertEqual(client.deleted, [a.id, b.id, c.id])
+
+    def test_skip_propagation(self):
+        client = _FakeNetworkClient(failing=['ocid1.vcn.oc1..a'])
+        a, b, c, d = self._vcns(client, 'a', 'b', 'c', 'd')
+        self.plan.add_dependency(a.id, b.id)
+        self.plan.add_dependency(b.id, c.id)
+
+        done, failed = self._run()
+        self.assertEqual(done, ['d'])
+        self.assertEqual(failed, {'a', 'b', 'c'})
+        # the skipped resources are not submitted
+        self.assertEqual(client.deleted, [d.id])
+
+    def test_optional_dependency(self):
+        client = _FakeNetworkClient(failing=['ocid1.vcn.oc1..a'])
+        a, b, c = self._vcns(client, 'a', 'b', 'c')
+        self.plan.add_dependency(a.id, b.id, optional=True)
+        self.plan.add_dependency(a.id, c.id)
+
+        done, failed = self._run()
+        self.assertEqual(done, ['b'])
+        self.assertEqual(failed, {'a', 'c'})
+
+    def test_dependency_cycle(self):
+        client = _FakeNetworkClient()
+        a, b, c = self._vcns(client, 'a', 'b', 'c')
+        self.plan.add_dependency(a.id, b.id)
+        self.plan.add_dependency(b.id, a.id)
+
+        done, failed = self._run()
+        self.assertEqual(done, ['c'])
+        self.assertEqual(failed, {'a', 'b'})
+        self.assertEqual(client.deleted, [c.id])
+
+    def test_preserved_compartment(self):
+        # a resource surviving the run keeps its compartment
+        compartment = OciCompartment(Compartment(id=COMPARTMENT, compartment_id=TENANCY, name='c',
+                                                 lifecycle_state='ACTIVE', freeform_tags={}, defined_tags={}))
+        kept = OciVcn(_model(Vcn, 'ocid1.vcn.oc1..kept'))
+        self.plan.add(compartment)
+        self.plan.add_preserved(kept)
+
+        done, failed = self._run()
+        self.assertEqual(done, [])
+        self.assertEqual(failed, {'c'})
+
+
+if __name__ == '__main__':
+    unittest.main()
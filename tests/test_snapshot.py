@@ -0,0 +1,161 @@
+import datetime
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from oci.core.models import Instance, RouteRule, RouteTable, Vcn
+from oci.identity.models import Compartment
+
+from oci_tools import RESOURCE as R
+from oci_tools import oci_config
+from oci_tools.oci_resources import OciCompartment, OciInstance, OciRouteTable, OciVcn
+from oci_tools.resource_registry import ResourceRegistry
+from oci_tools.serialization import dict_to_model, model_class_by_name, model_class_name, model_to_dict
+from oci_tools.snapshot import SnapshotStore
+
+TENANCY = 'ocid1.tenancy.oc1..t'
+COMPARTMENT = 'ocid1.compartment.oc1..c'
+REGION = 'us-ashburn-1'
+
+CONFIG = """[DEFAULT]
+user=ocid1.user.oc1..u
+fingerprint=aa:bb:cc:dd:ee:ff:00:11:22:33:44:55:66:77:88:99
+key_file={key_file}
+tenancy={tenancy}
+region={region}
+
+[OCI_TOOLS]
+preserve_tags=keep=true
+"""
+
+
+class _FakeClient:
+    pass
+
+
+def _instance():
+    return Instance(id='ocid1.instance.oc1..instance', compartment_id=COMPARTMENT, display_name='instance',
+                    lifecycle_state='RUNNING', freeform_tags={'keep': 'true'},
+                    defined_tags={'ops': {'owner': 'admin', 'cost': 10}},
+                    time_created=datetime.datetime(2020, 5, 1, 10, 30, tzinfo=datetime.timezone.utc),
+                    metadata={'ssh_authorized_keys': 'ssh-rsa AAAA'})
+
+
+def _route_table():
+    return RouteTable(id='ocid1.rt.oc1..rt', compartment_id=COMPARTMENT, vcn_id='ocid1.vcn.oc1..vcn',
+                      display_name='rt', lifecycle_state='AVAILABLE', freeform_tags={}, defined_tags={},
+                      route_rules=[RouteRule(destination='0.0.0.0/0', network_entity_id='ocid1.igw.oc1..igw')])
+
+
+class SerializationTest(unittest.TestCase):
+    """
+    SDK models converted to dicts and back
+    """
+
+    def test_round_trip(self):
+        for model in (_instance(), _route_table()):
+            data = model_to_dict(model)
+            rebuilt = dict_to_model(type(model), data)
+            self.assertEqual(rebuilt, model)
+            self.assertEqual(model_to_dict(rebuilt), data)
+
+    def test_nested_models(self):
+        rebuilt = dict_to_model(RouteTable, model_to_dict(_route_table()))
+
+        self.assertIsInstance(rebuilt.route_rules[0], RouteRule)
+        self.assertEqual(rebuilt.route_rules[0].network_entity_id, 'ocid1.igw.oc1..igw')
+
+    def test_datetime(self):
+        data = model_to_dict(_instance())
+        self.assertEqual(data['time_created'], '2020-05-01T10:30:00+00:00')
+        self.assertEqual(dict_to_model(Instance, data).time_created, _instance().time_created)
+
+    def test_model_class_name(self):
+        self.assertIs(model_class_by_name(model_class_name(Instance)), Instance)
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    """
+    compartment trees saved and reloaded, the snapshots expire after snapshot_ttl
+    and when the settings affecting the discovery change
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.config_path = os.path.join(self.directory, 'config')
+        with open(self.config_path, 'w') as f:
+            f.write(CONFIG.format(key_file=self.config_path, tenancy=TENANCY, region=REGION))
+        self.client = _FakeClient()
+
+        self.tree = OciCompartment(Compartment(id=COMPARTMENT, compartment_id=TENANCY, name='c',
+                                               lifecycle_state='ACTIVE', freeform_tags={}, defined_tags={}),
+                                   self.client)
+        vcn = OciVcn(Vcn(id='ocid1.vcn.oc1..vcn', compartment_id=COMPARTMENT, display_name='vcn',
+                         lifecycle_state='AVAILABLE', freeform_tags={}, defined_tags={}), self.client)
+        vcn.append(OciRouteTable(_route_table(), self.client))
+        self.tree.append(vcn)
+        self.instance = OciInstance(_instance(), self.client)
+        self.registry = ResourceRegistry()
+        self.registry.add_preserved(REGION, COMPARTMENT, self.instance)
+
+    def _store(self, **kwargs):
+        conf = oci_config.OCIConfig(self.config_path, cache_dir=os.path.join(self.directory, 'cache'),
+                                    **{'snapshot_ttl': '3600', **kwargs})
+        return SnapshotStore(conf)
+
+    def test_round_trip(self):
+        store = self._store()
+        store.save(REGION, [self.tree], self.registry)
+
+        registry = ResourceRegistry()
+        trees = store.load(REGION, {'_FakeClient': self.client}, registry)
+
+        self.assertEqual([tree.to_json() for tree in trees], [self.tree.to_json()])
+        route_table = trees[0][R.VCN][0][R.ROUTE_TABLE][0]
+        self.assertIsInstance(route_table, OciRouteTable)
+        self.assertIs(route_table.api_client, self.client)
+        self.assertEqual(route_table.reference('route_rules.network_entity_id'), ('ocid1.igw.oc1..igw',))
+        (scope, preserved), = registry.preserved(REGION)
+        self.assertEqual(scope, COMPARTMENT)
+        self.assertEqual(preserved.to_json(), self.instance.to_json())
+
+    def test_ttl(self):
+        store = self._store()
+        self.assertIsNone(store.timestamp(REGION))
+
+        store.save(REGION, [self.tree], self.registry)
+        self.assertIsNotNone(store.timestamp(REGION))
+
+        store.save(REGION, [self.tree], self.registry, timestamp=time.time() - 7200)
+        self.assertIsNone(store.timestamp(REGION))
+        self.assertIsNotNone(store.timestamp(REGION, max_age=10800))
+
+    def test_disabled(self):
+        store = self._store(snapshot_ttl='0')
+        store.save(REGION, [self.tree], self.registry)
+
+        self.assertIsNone(store.timestamp(REGION))
+        self.assertIsNone(self._store().timestamp(REGION))
+
+    def test_settings(self):
+        # a snapshot taken with different discovery settings is not valid
+        self._store().save(REGION, [self.tree], self.registry)
+
+        self.assertIsNone(self._store(compartment_filter='training-*').timestamp(REGION))
+        self.assertIsNone(self._store(preserve_tags='lock').timestamp(REGION))
+        self.assertIsNotNone(self._store().timestamp(REGION))
+
+    def test_invalidate(self):
+        store = self._store()
+        store.save(REGION, [self.tree], self.registry)
+        store.invalidate(REGION)
+
+        self.assertIsNone(store.timestamp(REGION))
+        self.assertEqual(store.load(REGION, {'_FakeClient': self.client}, ResourceRegistry()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
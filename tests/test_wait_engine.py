@@ -0,0 +1,173 @@
+import threading
+import time
+import unittest
+from collections import Counter
+
+from oci.core.models import Vcn
+from oci.exceptions import ServiceError
+from oci.response import Response
+
+from oci_tools.oci_resources import OciVcn
+from oci_tools.wait_engine import WaitEngine, _PendingTermination
+
+COMPARTMENT = 'ocid1.compartment.oc1..c'
+
+
+def _model(id, lifecycle_state):
+    return Vcn(id=id, compartment_id=COMPARTMENT, display_name=id.rpartition('.')[2],
+               lifecycle_state=lifecycle_state, freeform_tags={}, defined_tags={})
+
+
+class _FakeNetworkClient:
+    """
+    vcn state operations returning the states of the fake tenancy
+    """
+
+    def __init__(self, states):
+        """
+        :param states: vcn OCID -> lifecycle state. The vcns not in states don't exist
+        """
+        self.states = states
+        self.calls = Counter()
+        self.error = None
+        self.list_error = None
+
+    def get_vcn(self, id):
+        self.calls['get_vcn'] += 1
+        if self.error:
+            raise self.error
+        if id not in self.states:
+            raise ServiceError(404, 'NotAuthorizedOrNotFound', {}, 'vcn {} not found'.format(id))
+        return Response(200, {}, _model(id, self.states[id]), None)
+
+    def list_vcns(self, compartment_id=None, **kwargs):
+        self.calls['list_vcns'] += 1
+        if self.error or self.list_error:
+            raise self.error or self.list_error
+        return Response(200, {}, [_model(id, state) for id, state in self.states.items()], None)
+
+
+class WaitEngineTest(unittest.TestCase):
+    """
+    the pending terminations are polled until the resources are terminated or max_wait expires
+    """
+
+    def setUp(self):
+        self.engine = WaitEngine(min_interval=0.01, max_interval=0.05, max_wait=5)
+
+    def _vcns(self, client, *names):
+        vcns = []
+        for name in names:
+            id = 'ocid1.vcn.oc1..' + name
+            client.states[id] = 'TERMINATING'
+            vcns.append(OciVcn(_model(id, 'TERMINATING'), client))
+        return vcns
+
+    def _terminate_later(self, client, *vcns):
+        def _terminate():
+            for vcn in vcns:
+                client.states[vcn.id] = 'TERMINATED'
+        timer = threading.Timer(0.1, _terminate)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def test_terminated(self):
+        client = _FakeNetworkClient({})
+        vcn, = self._vcns(client, 'a')
+        self._terminate_later(client, vcn)
+
+        self.assertTrue(self.engine.track(vcn).result(timeout=5))
+        self.assertEqual(vcn.lifecycle_state, 'TERMINATED')
+        # the state is checked until the termination completes
+        self.assertGreater(client.calls['get_vcn'], 1)
+
+    def test_not_found(self):
+        client = _FakeNetworkClient({})
+        vcn, = self._vcns(client, 'a')
+        del client.states[vcn.id]
+
+        self.assertTrue(self.engine.track(vcn).result(timeout=5))
+
+    def test_timeout(self):
+        engine = WaitEngine(min_interval=0.01, max_interval=0.05, max_wait=0.2)
+        client = _FakeNetworkClient({})
+        vcn, = self._vcns(client, 'a')
+
+        start = time.time()
+        self.assertFalse(engine.track(vcn).result(timeout=5))
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_refresh_error(self):
+        client = _FakeNetworkClient({})
+        vcn, = self._vcns(client, 'a')
+        client.error = ServiceError(500, 'InternalError', {}, 'internal error')
+
+        self.assertFalse(self.engine.track(vcn).result(timeout=5))
+
+    def test_poll_group(self):
+        # the vcns of the same compartment are refreshed with a single list call
+        client = _FakeNetworkClient({})
+        vcns = self._vcns(client, 'a', 'b', 'c')
+        self._terminate_later(client, *vcns)
+
+        futures = [self.engine.track(vcn) for vcn in vcns]
+        self.assertEqual([future.result(timeout=5) for future in futures], [True] * 3)
+        self.assertGreater(client.calls['list_vcns'], 0)
+        self.assertEqual(client.calls['get_vcn'], 0)
+
+    def test_poll_group_error(self):
+        # the vcns are checked one by one when the list call fails
+        client = _FakeNetworkClient({})
+        vcns = self._vcns(client, 'a', 'b')
+        for vcn in vcns:
+            del client.states[vcn.id]
+        client.list_error = ServiceError(400, 'InvalidParameter', {}, 'invalid parameter')
+
+        futures = [self.engine.track(vcn) for vcn in vcns]
+        self.assertEqual([future.result(timeout=5) for future in futures], [True] * 2)
+        self.assertEqual(client.calls['get_vcn'], 2)
+
+    def test_backoff(self):
+        engine = WaitEngine(min_interval=1, max_interval=2, backoff=1.5)
+        client = _FakeNetworkClient({})
+        vcn, = self._vcns(client, 'a')
+        pending = _PendingTermination(vcn, None, 1, 10)
+
+        engine._reschedule(pending)
+        self.assertEqual(pending.interval, 1.5)
+        engine._reschedule(pending)
+        self.assertEqual(pending.interval, 2)
+
+    def test_idle(self):
+        # the polling thread stops when no termination is pending and it is restarted by track
+        client = _FakeNetworkClient({})
+        for name in ('a', 'b'):
+            vcn, = self._vcns(client, name)
+            client.states[vcn.id] = 'TERMINATED'
+            self.assertTrue(self.engine.track(vcn).result(timeout=5))
+            deadline = time.time() + 5
+            while self.engine._thread is not None and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertIsNone(self.engine._thread)
+            self.assertEqual(len(self.engine), 0)
+            self.assertTrue(self.engine.is_alive())
+
+    def test_unexpected_error(self):
+        # an error of the polling doesn't stop the engine
+        client = _FakeNetworkClient({})
+        vcn, = self._vcns(client, 'a')
+        poll = self.engine._poll
+
+        def _failing_poll(due):
+            self.engine._poll = poll
+            raise RuntimeError('poll failed')
+        self.engine._poll = _failing_poll
+
+        self.assertFalse(self.engine.track(vcn).result(timeout=5))
+        other, = self._vcns(client, 'b')
+        client.states[other.id] = 'TERMINATED'
+        self.assertTrue(self.engine.track(other).result(timeout=5))
+
+
+if __name__ == '__main__':
+    unittest.main()